@@ -0,0 +1,64 @@
+## Aggregate index over one reported day of the active-schools data set
+##
+## A single groupby over the rows at the finest key (municipality, school)
+## feeds everything else: municipality and school-name totals are rolled up
+## from it, both rankings are sorted once, and a suffix count over the school
+## totals answers "how many schools have at least N cases" by lookup.
+
+import numpy as np
+
+
+class AggregateIndex(object):
+    """Rankings and thresholds for one day of active cases, board sites excluded."""
+
+    def __init__(self, df_now, value="total_confirmed_cases"):
+        rows = df_now[~df_now.is_board_site]
+        by_school = rows.groupby(["municipality", "school"], observed=True)[value].sum()
+
+        ## Totals per municipality and per school name, rolled up from by_school
+        self._build(by_school.reset_index(),
+                    by_school.groupby(level="municipality", observed=True).sum().reset_index(),
+                    by_school.groupby(level="school", observed=True).sum().reset_index(),
+                    value)
+
+    @classmethod
+    def from_totals(cls, schools, municipalities, school_names, value="total_confirmed_cases"):
+        """An index over totals aggregated elsewhere, e.g. in SQL by a database backend.
+
+        Each frame holds its key columns and `value`, board sites already excluded.
+        """
+        index = cls.__new__(cls)
+        index._build(schools, municipalities, school_names, value)
+        return index
+
+    def _build(self, schools, municipalities, school_names, value):
+        self.value = value
+
+        ## (municipality, school) totals and both rollups, largest first
+        self.schools = self._ranked(schools)
+        self.municipalities = self._ranked(municipalities)
+        self.school_names = self._ranked(school_names)
+
+        ## at_least[n] is the number of schools with a total of n or more cases
+        totals = np.clip(self.schools[value].to_numpy(), 0, None).astype(np.int64)
+        counts = np.bincount(totals) if len(totals) else np.zeros(1, dtype=np.int64)
+        self._at_least = np.cumsum(counts[::-1])[::-1]
+
+    def _ranked(self, totals):
+        return totals.sort_values(self.value, ascending=False, kind="mergesort").reset_index(drop=True)
+
+    def top_municipalities(self, n):
+        return self.municipalities.head(n)
+
+    def top_schools(self, n):
+        """The n school names with the most cases, summed across municipalities."""
+        return self.school_names.head(n)
+
+    def schools_with_at_least(self, threshold):
+        """Number of (municipality, school) pairs with `threshold` or more cases."""
+        if threshold <= 0:
+            return len(self.schools)
+        if threshold >= len(self._at_least):
+            return 0
+        return int(self._at_least[threshold])
+
@@ -2,401 +2,50 @@
 
 # Required Libraries:
 
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import startup
 
-import pandas as pd
-from datetime import datetime
-from datetime import timedelta
+## pandas and pyarrow are not imported here: the refresher thread imports
+## them with the data modules, and views is imported by the callbacks, which
+## only run once a snapshot is loaded
+with startup.phase("imports"):
+    import os
+    import time
 
-import dash
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output
+    import flask
 
+    import dash
+    from dash.dependencies import Input, Output, State
+    from dash.exceptions import PreventUpdate
 
-# Import the Data sets:
+    import config
+    import memo
+    import metrics
+    import serialize
+    from fetch import write_atomic
+    from layout import render_layout
+    from refresh import DataRefresher
 
-### Summary of COVID-19 Cases in Ontario Schools ***
 
-url = "https://data.ontario.ca/dataset/b1fef838-8784-4338-8ef9-ae7cfd405b41/resource/7fbdbb48-d074-45d9-93cb-f7de58950418/download/schoolcovidsummary.csv"
-df_sum = pd.read_csv(url)
+# Load the Data sets and build the figure in the background:
+## The refresher reloads both data sets on a schedule and swaps in a new
+## snapshot once the frames and the figure are fully built. In shared mode
+## the loader process does that once for all workers and they attach to it.
 
-## Change the 'reported_date' column to a datetime object and drop 'collected_date'
-df_sum["reported_date"] = pd.to_datetime(df_sum["reported_date"])
-df_sum.drop("collected_date", axis=1, inplace=True)
-
-
-### Ontario Schols with Active Case Data set
-url = "https://data.ontario.ca/dataset/b1fef838-8784-4338-8ef9-ae7cfd405b41/resource/8b6d22e2-7065-4b0f-966f-02640be366f2/download/schoolsactivecovid.csv"
-df_active = pd.read_csv(url, encoding='latin-1')
-df_active["reported_date"] = pd.to_datetime(df_active["reported_date"])
-
-## Drop collected_date from Active data set
-df_active.drop("collected_date", axis=1, inplace=True)
-
-# Change the name of one catholique elementary school
-cass = df_active[df_active.school.str.contains('taire catholique de Casselman')]
-cass_index = cass.index
-df_active.at[cass_index, 'school'] = 'Catholic Elementary School de Casselman'
-
-cole = df_active[df_active["school"].str.contains('Ãcole Ã©lÃ©mentaire catholique Saint-Isidore')]
-cole_index = cole.index
-df_active.at[cole_index, 'school'] = 'Saint-Isidore Catholic Elementary School'
-
-
-
-## Filter the Active Cases Data set for the last_reported date
-df_active_now = df_active[df_active.reported_date == max(df_active.reported_date)]
-
-#Drop Board Site from active_now:
-board_site_index = df_active_now[df_active_now.school.str.contains('Board')].index
-if len(board_site_index) > 0:
-    df_active_now = df_active_now.drop(board_site_index)
-
-
-## Group the active_now data set by municipality
-df_municipality_now = df_active_now.groupby("municipality")['total_confirmed_cases'].sum().reset_index().sort_values(by=["total_confirmed_cases"], ascending=False).head(30)
-
-
-## Set the index of the summary data set to the reported_date column
-## Average the cases per week: Week Starting Sunday
-datetime_index = pd.DatetimeIndex(df_sum.reported_date.values)
-df_weekly = df_sum.set_index(datetime_index)
-df_weekly.drop('reported_date', axis=1, inplace = True)
-
-## Add week number to weekly data set
-df_weekly['week_num'] = df_weekly.index.isocalendar().week
-
-## Ontario Schools COVID-19 Cases Summary data set - Weekly Average
-df_weekly = df_weekly.new_total_school_related_cases.resample("W").mean().round()
-df_weekly = df_weekly.reset_index()
-
-### FINDING THE NEW CASES TOTALS OF THE DAY FOR STUDENTS, STAFF and TOTAL ###
-# Latest Total School Case Number
-value_t  = df_sum.loc[df_sum.index[-1], 'new_total_school_related_cases']
-
-# Previous Day School Total
-reference_t = df_sum.loc[df_sum.index[-2], 'new_total_school_related_cases']
-# Latest Total School Case Number
-value_student  = df_sum.loc[df_sum.index[-1], 'new_school_related_student_cases']
-
-# Previous Day School Total
-reference_student = df_sum.loc[df_sum.index[-2], 'new_school_related_student_cases']
-
-# Latest Total School Case Number
-value_staff  = df_sum.loc[df_sum.index[-1], 'new_school_related_staff_cases']
-
-# Previous Day School Total
-reference_staff = df_sum.loc[df_sum.index[-2], 'new_school_related_staff_cases']
-
-# Schools with 2 or more cases
-df_schools_total_active_now = df_active_now.groupby(["municipality","school"])['total_confirmed_cases'].sum().reset_index().sort_values(by = "total_confirmed_cases", ascending = False)
-schools_w_two_or_more = df_schools_total_active_now[df_schools_total_active_now.total_confirmed_cases >= 2].school.count()
-
-
-#### CREATE THE DASHBOARD ####
-#annotations = []
-
-fig = make_subplots(
-        rows = 5, cols = 6, row_heights = [0.2, 0.2, 0.2, 0.2, 0.2],
-        #vertical_spacing=0.03,
-        specs = [
-                    [ {"type": "indicator"}, {"type": "indicator"}, {"type": "indicator"}, {"type" : "indicator"}, {"type" : "indicator"}, {"type" : "indicator"} ],
-                    [ {"type" : "scatter", "rowspan": 2, "colspan" : 2}, None, {"type" : "bar", "rowspan" : 2, "colspan" : 2}, None, {"type" : "table", "rowspan" : 2, "colspan":2}, None],
-                    [  None, None, None, None, None, None],
-                    [{"type" : "bar", "rowspan": 2, "colspan" : 4}, None, None, None, None, None],
-                    [  None, None, None, None, {"type": "indicator", "rowspan" : 1, "colspan" : 2}, None],
-                ],
-     subplot_titles = ("","","","","","","Cumulative COVID-19 Cases","Weekly Average COVID-19 Cases",
-                       "Top Schools with Active COVID-19 Cases", f"Confirmed COVID-19 Case Numbers in <br>Ontario Municipalities On:{max(df_sum.reported_date).date()}", ""),
-)
-
-last_reported_date = max(df_sum.reported_date)
-first_reported_date = min(df_sum.reported_date).date()
-
-fig.add_trace(
-       go.Scatter(
-        x = df_sum['reported_date'],
-        y = df_sum['cumulative_school_related_cases'],
-        mode = 'lines+markers',
-        marker = dict(size = 5,
-                      line = dict( width = 1.2, color = '#5DADE2'))
-       ),
-        row = 2, col = 1
-     )
-
-
-#fig.update_layout(
-#        title = f"Cumulative COVID-19 Cases in Students, Staff & Total <br> Report Updated: {first_reported_date }",
-#)
-
-fig.add_trace(
-    go.Indicator(
-        value = value_t,
-        delta = {'reference': reference_t, 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
-        mode = "number+delta",
-        #number = {"font" : {"size" : 60}},
-        title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Reported Cases</span>"},
-    ),
-    row = 1, col = 1
-)
-
-fig.add_trace(
-    go.Indicator(
-        value = value_student,
-        delta = {'reference': reference_student, 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
-        mode = "number+delta",
-        #number = {"font" : {"size" : 60}},
-        title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Student</span>"},
-        domain = {'row': 0, 'column': 2}),
-     row = 1, col = 2
-)
-
-fig.add_trace(
-    go.Indicator(
-        mode = "number+delta",
-        value = value_staff,
-        delta = {"reference": reference_staff, 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
-        #number = {"font" : {"size" : 60}},
-        title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Staff</span>"},
-        domain = {'row': 0, 'column': 1}),
-    row = 1, col = 3
-)
-
-schools_w_cases = df_sum.current_schools_w_cases[df_sum.reported_date == max(df_sum.reported_date)].values[0]
-y_schools_w_cases = df_sum.loc[df_sum.index[-2], 'current_schools_w_cases']
-
-total_schools_ont = max(df_sum.current_total_number_schools)
-perc_school_cases = str(round(schools_w_cases / total_schools_ont, 1) * 100)
-
-if perc_school_cases[-1] == '0':
-    perc_school_cases = perc_school_cases[0:2]
-
-fig.add_trace(
-    go.Indicator(
-        mode = 'number+delta',
-        value = schools_w_cases,
-        delta = {'reference' : y_schools_w_cases, 'increasing' : {'color' : '#5DADE2' }},
-        #number = {"font" : {"size" : 70}},
-        title = {"text" : f" <br><span style = 'font-size: 0.7em; color:#294C63'>Schools with <br>Active Cases <br> ({perc_school_cases}% ONT)</span>"}),
-    row = 1, col = 4
-)
-
-
-value = df_sum.loc[df_sum.index[-1], 'current_schools_closed']
-value_yest = df_sum.loc[df_sum.index[-2], 'current_schools_closed']
-
-fig.add_trace(
-    go.Indicator(
-        mode = 'number+delta',
-        delta = {'reference' : value_yest, 'increasing' : {'color' : '#5DADE2' }},
-        value = value,
-        #number = {"font" : {"size" : 60}},
-        title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Schools Closed</span>"},
-        ),
-    row = 1, col = 5)
-
-
-days_remain = 194 - df_sum.reported_date.count()
-fig.add_trace(
-    go.Indicator(
-        mode = "gauge+number",
-        value = df_sum.reported_date.count(),
-        title = {'text': f"<span style='font-size:0.7em; color:#294C63'> Schools Days Completed:<br> {days_remain} To Go </span>"},
-        #number = {"font" : {"size" : 60}},
-        gauge = {
-            'axis' : { 'range' : [0, 195]},
-            'bar' : {'color' : '#5DADE2'},
-            'threshold' : {'line' : {'color': "crimson", 'width' : 4}, 'thickness': 0.90, 'value' : 194}}
-
-    ),
-    row = 5, col = 5
-)
-
-
-fig.add_trace(
-    go.Indicator(
-        mode = 'number+delta',
-        value = schools_w_two_or_more,
-        title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Schools with <br>at least 2 <br>Active Cases</span>"},
-        #number = {"font" : {"size" : 60}}
-    ),
-    row = 1, col = 6)
-
-
-colors = ['#5DADE2',] * len(df_municipality_now)
-colors[0] = 'crimson'
-
-fig.add_trace(
-    go.Bar(y = df_municipality_now["total_confirmed_cases"], x = df_municipality_now["municipality"],
-            marker = dict(color = df_municipality_now["total_confirmed_cases"], coloraxis="coloraxis"),
-           text = df_municipality_now['total_confirmed_cases'],
-           textposition = 'outside'
-           ),
-    row = 4, col = 1
-)
-
-colors_two = ['#5DADE2',] * len(df_weekly)
-colors_two[-1] = 'crimson'
-df_weekly.rename(columns= {"index" : "Start of Week", "new_total_school_related_cases" : "Weekly Average COVID-19 Cases"}, inplace = True)
-
-fig.add_trace(
-            go.Bar(y = df_weekly["Weekly Average COVID-19 Cases"], x = df_weekly["Start of Week"],
-                   marker = dict(color = df_municipality_now["total_confirmed_cases"], coloraxis="coloraxis"),
-                  text = df_weekly["Weekly Average COVID-19 Cases"],
-                  textposition = 'outside'),
-    row = 2, col = 3
-)
-
-
-
-
-# Top Schools with Active CASES
-top_10_schools = df_active_now.groupby('school')['total_confirmed_cases'].sum().reset_index().sort_values(by = "total_confirmed_cases", ascending = False).head(25)
-top_10_schools = top_10_schools.rename({"total_confirmed_cases" : "Active Cases", "school": "School"}, axis = 1)
-top_10_schools.reset_index(inplace = True)
-
-# Number of schools in ONT with at least 2 confirmed case:
-schools_with_one_case = df_active["school"].nunique()
-perc_schools_one = round(schools_with_one_case/total_schools_ont, 1)
-
-
-# colors = ['#5DADE2',] * len(top_10_schools)
-# colors[0] = 'crimson'
-#
-# fig.add_trace(
-#             go.Bar(x = top_10_schools["Active Cases"], y = top_10_schools["School"],
-#                 orientation='h',
-#                 marker_color = colors,
-#                 text = top_10_schools["Active Cases"],
-#                 textposition = 'outside'
-#                   ),
-#     row = 2, col = 5
-# )
-# add Table instead of Bar PLOT
-fig.add_trace(
-    go.Table(
-        columnorder = [1, 2],
-        columnwidth = [200, 80],
-        header=dict(values=[['<b>SCHOOL</b>'],['<b>CASES</b>']],
-                line_color='#F8F9F9',
-                fill_color='#5DADE2',
-                align=['left','center'],
-                font = dict(color='#154360', size = 13),
-                height = 25
-                ),
-        cells=dict(values= [top_10_schools[k].tolist() for k in top_10_schools.columns[1:]], # 2nd column
-               line_color='#F8F9F9',
-               fill_color=[['#F5F5F5','#A4CDE8']* len(top_10_schools)],
-               align=['left', 'center'],
-               font = dict(color = '#154360', size = 13),
-               height = 25)
-    ),
-    row=2, col = 5
-)
-
-
-####################################  UPDATE LAYOUT ########################################################
-
-fig.update_layout(
-    template = "plotly_white",
-    #title = {
-    #    'text' : f"ONTARIO COVID-19 CASES in SCHOOLS\n <b>(Updated: {max(df_sum.reported_date).date()} )",
-    #    'x' : 0.04,
-    #    'y' : 0.97,
-    #    'xanchor' : 'left'},
-    title_x = 0.05,
-    title_font_color = '#3D92A8',
-    showlegend = False,
-    yaxis_title = "Cumulative Cases",
-    titlefont = dict(
-            size = 12))
-    #margin = dict(pad = 2)\
-
-
-
-# fig.update_xaxes(
-#     tickangle = -30,
-#     tickfont = dict(size = 14)
-# )
-
-# fig.update_yaxes(
-#     showgrid = True, gridcolor = "lightgrey")
-
-fig['layout']['yaxis1'].update(automargin = True, range = [0, 8000], showgrid = True, gridcolor = 'lightgrey')
-fig['layout']['yaxis2'].update(showgrid=True, showticklabels = False, range = [0, 300])
-fig['layout']['yaxis3'].update(showgrid=True, showticklabels = False, range = [0, 900])
-#fig['layout']['yaxis3'].update(showgrid=False, showticklabels = False)
-fig['layout']['xaxis1'].update(tickangle= 0, showgrid = False, automargin = False,
-                                tickfont=dict(size = 11),
-                                dtick = 'M1',
-                                tickformat = "%b %d\n%y")
-fig['layout']['xaxis3'].update(tickangle = -40, title = "Top 30 Municipalities",
-                                tickfont=dict(size = 11))
-#fig['layout']['yaxis2'].update(showgrid=False, showticklabels = False)
-fig['layout']['xaxis2'].update(tickangle = 0,
-                               title_font_color = "#3D92A8",
-                               tickfont=dict(size = 11),
-                               dtick = 'M1',
-                               tickformat = "%b %d\n%Y")
-#fig['layout']['xaxis3'].update(showgrid=False, showticklabels = False, range = [0, 80],
-#                              title = "Case Number & Associated School", title_font_color = "#3D92A8",
-#                              )
-
-# Add annotations to Top 10 BarH
-
-
-# annotations.append(dict(xref = 'x3', yref = 'y3',
-#                     y = top_10_schools.iloc[0, 1], x = 63,
-#                     text = top_10_schools.iloc[0, 1],
-#                     font = dict(family = 'Verdana ', size = 10),
-#                     showarrow = False))
-# for i, t in enumerate(top_10_schools["School"]):
-#     if i < len(top_10_schools)-1:
-#         annotations.append(dict(xref = 'x3', yref='y3',
-#                              y = top_10_schools.iloc[i+1, 1], x = 63,
-#                              text = top_10_schools.iloc[i+1, 1],
-#                              font = dict(family = 'Verdana ', size = 10),
-#                              showarrow = False,
-#                              align = 'right'
-#                              )
-#         )
-
-
-# annotations.append(dict(xref = 'x1', yref = 'y1',
-#                   x = max(df_sum.reported_date) + timedelta(days=5)  , y = max(df_sum.cumulative_school_related_cases) - 200,
-#                   text = max(df_sum.cumulative_school_related_cases),
-#                   showarrow = False,
-#                   font = dict(
-#                       size = 18,
-#                       color = "white"),
-#                 bordercolor = 'crimson',
-#                 bgcolor = 'crimson'
-#                   ))
-#
-# annotations.append(dict(xref = 'x3', yref = 'y3',
-#                      y = max(df_municipality_now.iloc[:,1])-50,
-#                      x = "Ajax",
-#                      text = F"Currently Active COVID-19 Cases in Ontario Municipalities <br><b> {max(df_sum.reported_date).date()}",
-#                      showarrow = False,
-#                      font = dict(
-#                              size = 16,
-#                              color = '#3D92A8'),
-#                      ) )
-#
-# fig.update_layout(annotations = annotations)
-
-fig.update_layout(coloraxis=dict(colorscale="RdBu_r"))
-fig.layout.update(showlegend=False)
-fig.layout.coloraxis.update(showscale = False)
+if config.SHARED_DIR:
+    import shared
+    refresher = shared.SharedReader(config.SHARED_DIR)
+else:
+    refresher = DataRefresher().start()
 
 ######************************* PLOT BEGINS: ********************************######
 
 # Boostrap CSS
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
+## The controls are only in the layout once data is loaded, so callbacks are
+## registered against ids that the loading page does not have
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
+                suppress_callback_exceptions = True,
                 meta_tags = [
                 {"name": "viewpoint", "content": "width=device-width, initial-scale=1"}
                 ])
@@ -404,103 +53,230 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
 app.title = "ONT School COVID-19 Dashboard"
 server = app.server
 
-app.layout = html.Div(style = {'backgroundColor':'#711411', 'font-family': 'Verdana', 'margin-bottom' : '20px'}, children = [
-    html.H1(children = "COVID-19 CASES in  ONTARIO SCHOOLS",
-            style = {
-                'textAlign' : 'center',
-                'color' : 'lightgrey',
-                'padding-top' : '25px',
-                'padding-bottom' : '0px',
-                'font-size' : '220%',
-                'height' : '60px',
-                'line-height': 1.2,
-                'margin-top' : '30px',
-                'font-family':'Monaca',
-                'font-weight' : 'bold'
-            }),
-
-    #title = {'text': f"<span style='font-size:0.8em; color:#294C63'> Schools Days Completed:<br> {days_remain} To Go </span>"},
-    html.H5(children =   f"UPDATED: {max(df_sum.reported_date).date()}",
-            style = {
-                'textAlign' : 'center',
-                'color' : '#5DADE2',
-                'color' : 'lightgrey',
-                'padding-top' : '0px',
-                'font-size' : '25px',
-                'font-family':'Monaca',
-                'height' : '20px',
-                'line-height': 1.1,
-                'font-weight' : 'bold',
-                #'background-color' : 'lightblue'
-                'font-variant-caps': 'small-caps'}),
-
-    # html.Div(style={"backgroundColor":'white'}, children = [
-    #     dcc.Markdown('''f"* **{schools_with_one_case}** schools have had at least 1 confirmed COVID-19 case out of **{total_schools_ont}** schools in Ontario",
-    #                  f"* **{perc_school_cases}%** of Ontario schools have at least 1 active case",''',
-    #
-    #             style = {"color" : "black",
-    #                     "padding-top" : "40px",
-    #                     "margin-left": "70px",
-    #                     "margin-top" : '10px',
-    #                     #"font-weight" : 'bold',
-    #                     "font-size" : "15px",
-    #                     "height" : "20px",
-    #                     #"backgroundColor" : "white"}),
-    #                     #"border-top" : '2px solid red'
-    #                     }),
-        #dcc.Markdown("test"),
-
-    dcc.Graph(
-        style = {'height':"100vh",
-                'margin-bottom' : '20px',
-                'margin-left' : '10px',
-                'margin-right' : '10px',
-                'margin-top' : '10px'},
-        config = {'responsive': True},
-        figure = fig,
-        ),
-
-    # html.P(children = '"Source:" <a ref> "https://data.ontario.ca/dataset/summary-of-cases-in-schools" target="_blank">  Schools COVID-19 Data</a>',
-    #                   style = {
-    #                       'textAlign' : 'right',
-    #                       'color' : 'lightgrey',
-    #                       'font' : 'Lucida Handwriting',
-    #                       'font-size' : '13',
-    #                       'font-style' : 'italic',
-    #                       'font-weight' : 'bold',
-    #                       'margin-bottom' : '10px',
-    #                       'margin-left' : '10x'
-    #                   }),
-
-    html.Footer("Created By: Peter Stangolis",
-                 style = {
-                     'textAlign' : 'left',
-                     'color' : 'lightgrey',
-                     'font' : 'Lucida Handwriting',
-                     'font-size' : '12',
-                     #'font-style' : 'italic',
-                     #'font-weight' : 'bold',
-                     'margin-bottom' : '10px',
-                     'margin-left' : '30px'
-                 }),
-    html.Label("Data obtained from the Ontario Governments website",
-            style = {
-                'textAlign' : 'left',
-                'color' : 'lightgrey',
-                'font-stye' : 'italic',
-                'margin-left' : '30px'
-            }),
-    html.A("Source", href="https://data.ontario.ca/dataset/summary-of-cases-in-schools",
-            target="_blank",
-            style = {
-                'textAlign' : 'left',
-                'color' : 'lightgrey',
-                'font-stye' : 'italic',
-                'margin-left' : '30px'
-            }
-            ),
-], className = 'ten columns offset-by-one'
-)
+def serve_layout():
+    ## Dash calls this on every page load, so each visitor gets the latest published snapshot
+    snapshot = refresher.current()
+    if snapshot is not None:
+        startup.ready()
+    return render_layout(snapshot)
+
+
+app.layout = serve_layout
+
+
+## Request latency per route. Registered before cached_layout so a layout
+## served from the cache is timed too
+@server.before_request
+def start_timer():
+    flask.g.request_start = time.perf_counter()
+
+
+@server.after_request
+def record_latency(response):
+    start = getattr(flask.g, "request_start", None)
+    if start is not None:
+        ## The route pattern, never the raw path, so the label values stay bounded
+        rule = flask.request.url_rule
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                        rule.rule if rule is not None else "unmatched", str(response.status_code))
+    return response
+
+
+## Serve /_dash-layout from bytes encoded once per data version instead of
+## letting Dash re-encode the whole figure on every page load
+layout_cache = serialize.VersionedCache()
+
+## The last encoded layout, kept on disk so a fresh process can show the
+## dashboard (FAST_BOOT) while its own first snapshot is still loading
+BOOT_LAYOUT = os.path.join(config.CACHE_DIR, "layout.json")
+boot_cache = serialize.VersionedCache()
+
+
+def _encode_layout(snapshot):
+    with metrics.stage("layout"):
+        if config.SHARED_DIR:
+            body = snapshot.layout_json()
+        else:
+            body = serialize.dumps(render_layout(snapshot))
+    if config.FAST_BOOT:
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        write_atomic(BOOT_LAYOUT, body)
+    return body
+
+
+def _boot_layout():
+    if not config.FAST_BOOT or not os.path.exists(BOOT_LAYOUT):
+        return None
+
+    def read():
+        with open(BOOT_LAYOUT, "rb") as fh:
+            return fh.read()
+    return boot_cache.get(os.path.getmtime(BOOT_LAYOUT), read)
+
+
+@server.before_request
+def cached_layout():
+    if not config.LAYOUT_CACHE or flask.request.path != app.config.routes_pathname_prefix + "_dash-layout":
+        return None
+    snapshot = refresher.current()
+    if snapshot is None:
+        encoded = _boot_layout()
+        return encoded.respond(flask.request) if encoded is not None else None
+    encoded = layout_cache.get(snapshot.version, lambda: _encode_layout(snapshot))
+    startup.ready()
+    return encoded.respond(flask.request)
+
+
+@app.callback(Output("summary-graph", "figure"),
+              [Input("kpi-reference", "value")],
+              prevent_initial_call = True)
+def update_summary_graph(reference):
+    ## The layout already holds the figure with the default reference
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or not reference:
+        raise PreventUpdate
+    return views.summary_figure(snapshot, reference)
+
+
+@app.callback(Output("map-graph", "figure"),
+              [Input("map-layer", "value"), Input("map-graph", "relayoutData")])
+def update_map(layer, relayout):
+    ## Zooming in past geo.LEVEL_SCALES swaps in the URL of a more detailed level
+    import geo
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or layer not in geo.layers():
+        raise PreventUpdate
+    scale = (relayout or {}).get("geo.projection.scale")
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if triggered == ["map-graph.relayoutData"] and scale is None:
+        raise PreventUpdate
+    geo_layer = geo.layers()[layer]
+    level = geo.level_for_scale(scale or 1, geo_layer.levels)
+    url = flask.url_for("geometry", layer=layer, level=level, v=geo_layer.version)
+    return views.map_figure(snapshot, layer, level, url)
+
+
+@app.callback(Output("filtered-graph", "figure"),
+              [Input("filter-date", "date"), Input("filter-municipality", "value"), Input("filter-board", "value")])
+def update_filtered_graph(date, municipality, board):
+    import views
+    snapshot = refresher.current()
+    if snapshot is None:
+        raise PreventUpdate
+    return views.filtered_figure(snapshot, date, municipality, board)
+
+
+@app.callback(Output("trend-graph", "figure"),
+              [Input("trend-series", "value"), Input("trend-aggregation", "value")])
+def update_trend_graph(column, aggregation):
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or not column or not aggregation:
+        raise PreventUpdate
+    return views.trend_figure(snapshot, column, aggregation)
+
+
+@app.callback([Output("school-table", "data"), Output("school-table", "page_count"), Output("school-table", "page_current")],
+              [Input("school-table", "page_current"), Input("school-table", "page_size"), Input("school-table", "sort_by"),
+               Input("filter-date", "date"), Input("filter-municipality", "value"), Input("filter-board", "value")])
+def update_school_table(page, size, sort_by, date, municipality, board):
+    ## Only the visible page is sent, sliced from the presorted orders of the
+    ## filtered selection; a new selection starts again from its first page
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or not size:
+        raise PreventUpdate
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if any(prop.startswith("filter-") for prop in triggered):
+        page = 0
+    rows, page_count = views.school_table_page(snapshot, page or 0, size, sort_by, date, municipality, board)
+    return rows, page_count, page or 0
+
+
+@app.callback(Output("school-select", "value"),
+              [Input("school-table", "active_cell")])
+def select_table_school(cell):
+    ## Rows carry the school id, so a clicked row opens that school's history
+    if not cell or cell.get("row_id") is None:
+        raise PreventUpdate
+    return cell["row_id"]
+
+
+@app.callback(Output("school-history-graph", "figure"),
+              [Input("school-select", "value")])
+def update_school_history(school_id):
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or not school_id:
+        raise PreventUpdate
+    return views.school_history_figure(snapshot, school_id)
+
+
+@app.callback(Output("school-select", "options"),
+              [Input("school-select", "search_value")],
+              [State("school-select", "value")])
+def update_school_options(query, school_id):
+    ## Any school can be picked by typing its name, not only the ones listed at page load
+    import views
+    snapshot = refresher.current()
+    if snapshot is None or not query:
+        raise PreventUpdate
+    return views.search_options(snapshot, query, school_id)
+
+
+@server.route("/_search")
+def search():
+    ## Type-ahead over every school and municipality name: ?q=<text>&limit=<n>
+    import views
+    snapshot = refresher.current()
+    if snapshot is None:
+        return flask.jsonify({"version": None, "results": []}), 503
+    limit = max(1, min(flask.request.args.get("limit", 10, type=int), 100))
+    results = views.search_index(snapshot).search(flask.request.args.get("q", ""), limit)
+    return flask.jsonify({
+        "version": snapshot.version,
+        "results": [{"kind": kind, "label": label, "value": value, "score": score}
+                    for score, (kind, label, value) in results],
+    })
+
+
+@server.route("/_geo/<layer>/<int:level>.json")
+def geometry(layer, level):
+    ## GeoJSON of one map layer and level. The URL carries the geometry
+    ## version, so browsers keep it for good and fetch it once
+    import geo
+    geo_layer = geo.layers().get(layer)
+    if geo_layer is None or not 0 <= level < geo_layer.levels:
+        flask.abort(404)
+    return geo_layer.encoded(level).respond(flask.request, cache_control="public, max-age=31536000, immutable")
+
+
+@server.route("/_stats/caches")
+def cache_stats():
+    ## Hit/miss/eviction counters of the memoized views, to size them in production
+    return flask.jsonify({name: cache.stats() for name, cache in memo.CACHES.items()})
+
+
+def _snapshot_age():
+    snapshot = refresher.current()
+    return {} if snapshot is None else {(): time.time() - snapshot.loaded_at}
+
+
+metrics.Gauge("ontschools_snapshot_age_seconds", "Seconds since the served data snapshot was built.", collect=_snapshot_age)
+
+
+@server.route("/metrics")
+def prometheus_metrics():
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@server.route("/_stats/startup")
+def startup_stats():
+    ## Seconds spent in each startup phase, and until the first data-backed layout
+    return flask.jsonify(startup.report())
+
 
 if __name__ == '__main__':
     app.run_server(debug=True)
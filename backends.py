@@ -0,0 +1,343 @@
+## Where the two data sets are loaded from
+##
+## Every backend has the same loader API: load(previous) returns a Loaded
+## holding the content hashes of both data sets, the summary frame, the
+## store.ActiveView of the current school year and, when the backend computed
+## it, the aggregates.AggregateIndex of the latest day; or None when neither
+## data set changed since the `previous` snapshot. config.DATA_BACKEND picks one:
+##
+##     remote               both CSVs from data.ontario.ca (the default)
+##     dir:/path/to/csvs    summary.csv and active.csv in a local directory
+##     sqlite:/path/to.db   the `summary` and `active` tables of a SQLite file
+##     duckdb:/path/to.db   the same tables in a DuckDB file
+##
+## The CSV backends go through the typed caches (FrameCache, ActiveStore).
+## The database backends push the work down as SQL instead: only the current
+## school year of the active table is read, and the school, municipality and
+## school-name totals of the latest day are GROUP BY queries, so a long
+## history never has to fit in Python memory. Either database can be filled
+## from the two CSVs with:
+##
+##     python backends.py sqlite:ontschools.db schoolcovidsummary.csv schoolsactivecovid.csv
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import duckdb
+except ImportError:
+    # Only the duckdb: backend needs it
+    duckdb = None
+
+import pandas as pd
+
+import config
+import data
+import metrics
+import normalize
+import schoolyear
+from aggregates import AggregateIndex
+from fetch import Fetcher, FetchResult
+from store import ActiveStore, ActiveView, FrameCache, aggregate_schools
+
+logger = logging.getLogger(__name__)
+
+Loaded = namedtuple("Loaded", ["hashes", "df_sum", "active", "aggregates"])
+
+## Data set name -> url
+SOURCES = {
+    "summary": config.SUMMARY_URL,
+    "active": config.ACTIVE_URL,
+}
+
+
+def _unchanged(previous, hashes, name):
+    return previous is not None and previous.hashes.get(name) == hashes[name]
+
+
+class CsvBackend(object):
+    """Both data sets as CSV files, parsed through the typed caches.
+
+    Only the data sets whose content changed are re-parsed; the active-schools
+    data set is ingested incrementally by the ActiveStore and the cleaned
+    summary frame is cached as typed Parquet.
+    """
+
+    def __init__(self, active_store=None, summary_cache=None):
+        self.active_store = ActiveStore() if active_store is None else active_store
+        self.summary_cache = FrameCache("summary") if summary_cache is None else summary_cache
+
+    def files(self, previous):
+        """{name: fetch.FetchResult} of both data sets, with their content hash in meta["sha256"]."""
+        raise NotImplementedError
+
+    def load(self, previous):
+        with metrics.stage("fetch"):
+            results = self.files(previous)
+        hashes = {name: result.meta["sha256"] for name, result in results.items()}
+        if previous is not None and hashes == previous.hashes:
+            return None
+
+        if _unchanged(previous, hashes, "summary"):
+            df_sum = previous.df_sum
+        else:
+            summary = results["summary"]
+            with metrics.stage("parse_summary"):
+                df_sum = self.summary_cache.load(summary.meta["sha256"], lambda: data.load_summary(summary.path))
+        if _unchanged(previous, hashes, "active"):
+            active = previous.active
+        else:
+            with metrics.stage("ingest_active"):
+                active = self.active_store.ingest(results["active"].path)
+        return Loaded(hashes, df_sum, active, None)
+
+
+class RemoteBackend(CsvBackend):
+    """The CSVs on data.ontario.ca, downloaded through the fetch layer.
+
+    The first load uses the local snapshot files when they exist, so a cold
+    start does not wait on data.ontario.ca. Later loads send conditional
+    requests for both data sets in parallel and keep the local copy of one
+    whose download failed.
+    """
+
+    def __init__(self, fetcher=None, active_store=None, summary_cache=None):
+        CsvBackend.__init__(self, active_store, summary_cache)
+        self.fetcher = Fetcher() if fetcher is None else fetcher
+        self._pool = ThreadPoolExecutor(max_workers=len(SOURCES), thread_name_prefix="fetch")
+
+    def _fetch(self, name, url):
+        ## Falls back to the last good local copy when upstream fails or its circuit is open
+        try:
+            return self.fetcher.fetch(name, url)
+        except Exception:
+            cached = self.fetcher.cached(name)
+            if cached is None:
+                raise
+            logger.warning("Fetching %s failed, keeping the local copy", name, exc_info=True)
+            return cached
+
+    def files(self, previous):
+        if previous is None:
+            cached = {name: self.fetcher.cached(name) for name in SOURCES}
+            if all(cached.values()):
+                return cached
+        ## Both downloads at once, so a refresh takes as long as the slower one
+        futures = {name: self._pool.submit(self._fetch, name, url) for name, url in SOURCES.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class DirectoryBackend(CsvBackend):
+    """summary.csv and active.csv in a local directory, e.g. kept up to date by another job."""
+
+    def __init__(self, directory, active_store=None, summary_cache=None):
+        CsvBackend.__init__(self, active_store, summary_cache)
+        self.directory = directory
+
+    def files(self, previous):
+        results = {}
+        for name in SOURCES:
+            path = os.path.join(self.directory, name + ".csv")
+            stat = os.stat(path)
+            ## Keyed on size and modification time: hashing a large file on every refresh would cost a full read
+            key = "%s|%d|%d" % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+            results[name] = FetchResult(name, path, {"sha256": hashlib.sha256(key.encode("utf-8")).hexdigest()})
+        return results
+
+
+## Cheap summaries of each table: a load is skipped when neither one changed.
+## MAX(rowid) moves when rows are deleted and inserted again, even with the
+## same values. An in-place UPDATE can keep the count, last day and sum of a
+## table, so each fingerprint also holds the size and modification time of
+## the database file and of its write-ahead log, which every committed write
+## changes: any write reloads both tables.
+FINGERPRINTS = {
+    "summary": "SELECT COUNT(*), MAX(reported_date), SUM(new_total_school_related_cases), MAX(rowid) FROM summary",
+    "active": "SELECT COUNT(*), MAX(reported_date), SUM(total_confirmed_cases), MAX(rowid) FROM active",
+}
+
+## Write-ahead log next to the database file, per engine
+WAL_SUFFIXES = {"sqlite": "-wal", "duckdb": ".wal"}
+
+## Rows of the latest reported day, without Board Sites. The flag is tested on
+## the raw names here and on the repaired ones in data.clean_active, which
+## only differ if a name fix adds or removes "Board".
+LATEST_ROWS = ("reported_date = (SELECT MAX(reported_date) FROM active) "
+               "AND instr(school, 'Board') = 0")
+
+## Totals of the latest day by each key of the AggregateIndex, largest first
+TOTALS = {
+    "schools": ["municipality", "school"],
+    "municipalities": ["municipality"],
+    "school_names": ["school"],
+}
+TOTALS_QUERY = ("SELECT {keys}, CAST(SUM(total_confirmed_cases) AS BIGINT) AS total_confirmed_cases "
+                "FROM active WHERE " + LATEST_ROWS + " GROUP BY {keys} ORDER BY total_confirmed_cases DESC")
+
+
+class SQLBackend(object):
+    """Both data sets as the `summary` and `active` tables of a SQLite or DuckDB database.
+
+    The tables have the columns of the CSVs, with the dates as ISO text (or
+    DATE in DuckDB); an index on active.reported_date keeps the year and
+    latest-day filters from scanning the table.
+    """
+
+    def __init__(self, path, engine="sqlite"):
+        if engine not in ("sqlite", "duckdb"):
+            raise ValueError("unknown database engine %r" % engine)
+        if engine == "duckdb" and duckdb is None:
+            raise ImportError("the duckdb backend needs the duckdb package")
+        self.path = path
+        self.engine = engine
+
+    @contextmanager
+    def _connect(self):
+        ## Read-only, so another process can keep the database up to date
+        if self.engine == "duckdb":
+            con = duckdb.connect(self.path, read_only=True)
+        else:
+            con = sqlite3.connect("file:%s?mode=ro" % urllib.parse.quote(os.path.abspath(self.path)), uri=True)
+        try:
+            yield con
+        finally:
+            con.close()
+
+    def _query(self, con, sql, params=()):
+        if self.engine == "duckdb":
+            return con.execute(sql, list(params)).fetchdf()
+        return pd.read_sql_query(sql, con, params=params)
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.path, self.path + WAL_SUFFIXES[self.engine]):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.extend([stat.st_size, stat.st_mtime_ns])
+        return signature
+
+    def _fingerprints(self, con):
+        ## -> ({name: hash}, last reported day of the active table)
+        hashes, last = {}, None
+        signature = self._file_signature()
+        for name, sql in FINGERPRINTS.items():
+            row = con.execute(sql).fetchone()
+            values = list(row) + signature
+            hashes[name] = hashlib.sha256("|".join(str(value) for value in values).encode("utf-8")).hexdigest()
+            if name == "active":
+                last = row[1]
+        return hashes, last
+
+    def _active(self, con, last):
+        ## The current school year only, like the view of the ActiveStore
+        year = schoolyear.start_year_of(pd.Timestamp(last))
+        start = "%d-%02d-01" % (year, schoolyear.FIRST_MONTH)
+        with metrics.stage("query_active"):
+            history = data.clean_active(self._query(
+                con, "SELECT * FROM active WHERE reported_date >= ? ORDER BY reported_date", (start,)))
+        latest = history[history.reported_date == history.reported_date.max()].reset_index(drop=True)
+        with metrics.stage("aggregate_schools"):
+            schools = aggregate_schools(history)
+        return ActiveView(history, latest, schools)
+
+    def _aggregates(self, con):
+        totals = {}
+        with metrics.stage("aggregate"):
+            for name, keys in TOTALS.items():
+                df = self._query(con, TOTALS_QUERY.format(keys=", ".join(keys)))
+                for col in keys:
+                    df[col] = df[col].astype("category")
+                ## Names the fixes make equal are summed again, on the few rows of the result
+                normalize.normalize_names(df, keys)
+                totals[name] = df.groupby(keys, observed=True).total_confirmed_cases.sum().reset_index()
+        return AggregateIndex.from_totals(totals["schools"], totals["municipalities"], totals["school_names"])
+
+    def load(self, previous):
+        with self._connect() as con:
+            with metrics.stage("fetch"):
+                hashes, last = self._fingerprints(con)
+            if previous is not None and hashes == previous.hashes:
+                return None
+            if last is None:
+                raise ValueError("the active table of %s is empty" % self.path)
+
+            if _unchanged(previous, hashes, "summary"):
+                df_sum = previous.df_sum
+            else:
+                with metrics.stage("query_summary"):
+                    df_sum = data.clean_summary(self._query(con, "SELECT * FROM summary ORDER BY reported_date"))
+            if _unchanged(previous, hashes, "active"):
+                active, aggregates = previous.active, previous.frames["aggregates"]
+            else:
+                active = self._active(con, last)
+                aggregates = self._aggregates(con)
+        return Loaded(hashes, df_sum, active, aggregates)
+
+
+def from_config(spec=None):
+    """The backend named by `spec` ("remote", "dir:<path>", "sqlite:<path>" or "duckdb:<path>")."""
+    spec = config.DATA_BACKEND if spec is None else spec
+    kind, _, target = spec.partition(":")
+    if kind == "remote":
+        return RemoteBackend()
+    if kind == "dir" and target:
+        return DirectoryBackend(target)
+    if kind in ("sqlite", "duckdb") and target:
+        return SQLBackend(target, kind)
+    raise ValueError("unknown data backend %r" % spec)
+
+
+def write_database(spec, summary_csv, active_csv, chunk_rows=config.INGEST_CHUNK_ROWS):
+    """(Re)create the `summary` and `active` tables of a database backend from the two CSVs."""
+    kind, _, path = spec.partition(":")
+    if kind == "duckdb":
+        if duckdb is None:
+            raise ImportError("the duckdb backend needs the duckdb package")
+        con = duckdb.connect(path)
+    elif kind == "sqlite":
+        con = sqlite3.connect(path)
+    else:
+        raise ValueError("not a database backend: %r" % spec)
+    try:
+        for table, source in (("summary", summary_csv), ("active", active_csv)):
+            with open(source, "rb") as fh:
+                encoding = normalize.detect_file_encoding(fh)
+            con.execute("DROP TABLE IF EXISTS %s" % table)
+            ## Dates and names stay text, so both engines compare them the same way
+            chunks = pd.read_csv(source, encoding=encoding, chunksize=chunk_rows,
+                                 dtype={col: str for col in ["collected_date", "reported_date"] + data.ACTIVE_CATEGORIES})
+            for i, chunk in enumerate(chunks):
+                if kind == "duckdb":
+                    con.register("chunk", chunk)
+                    con.execute(("CREATE TABLE %s AS SELECT * FROM chunk" if i == 0 else
+                                 "INSERT INTO %s SELECT * FROM chunk") % table)
+                    con.unregister("chunk")
+                else:
+                    chunk.to_sql(table, con, if_exists="append", index=False)
+        con.execute("CREATE INDEX active_reported_date ON active (reported_date)")
+        if kind == "sqlite":
+            con.commit()
+    finally:
+        con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the two data sets into a SQLite or DuckDB database.")
+    parser.add_argument("database", help="sqlite:<path> or duckdb:<path>")
+    parser.add_argument("summary_csv")
+    parser.add_argument("active_csv")
+    args = parser.parse_args()
+    write_database(args.database, args.summary_csv, args.active_csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+## Peak RSS of ingesting the active-schools CSV: whole file vs. chunked
+##
+## Writes a synthetic schoolsactivecovid.csv at `--scale` (see synthetic.py),
+## then ingests it in a fresh interpreter per path:
+##
+##   whole   data.load_active on the file, the way refreshes used to parse it
+##   stream  ActiveStore.ingest, parsing config.INGEST_CHUNK_ROWS rows at a time
+##
+## The stream frame is the store's view, which only holds the current school
+## year, so with several years (scale 10 and up) its rows and frame_mb cover
+## less than the whole-file frame.
+##
+##     python benchmarks/ingest_rss.py --scale 10
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic
+
+
+def ingest_whole(path, _):
+    import data
+    return data.load_active(path)
+
+
+def ingest_stream(path, directory):
+    from store import ActiveStore
+    return ActiveStore(directory).ingest(path).history
+
+
+PATHS = {"whole": ingest_whole, "stream": ingest_stream}
+
+
+def run_one(path, csv_path):
+    directory = tempfile.mkdtemp(prefix="ontschools-ingest-")
+    try:
+        start = time.perf_counter()
+        df = PATHS[path](csv_path, directory)
+        elapsed = time.perf_counter() - start
+        print(json.dumps({
+            "path": path,
+            "seconds": round(elapsed, 3),
+            "rows": len(df),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "frame_mb": round(df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+        }))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak RSS of whole-file and chunked CSV ingestion.")
+    parser.add_argument("--scale", type=int, choices=sorted(synthetic.SCALES), default=10)
+    parser.add_argument("--child", choices=sorted(PATHS), help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_one(args.child, args.csv)
+
+    directory = tempfile.mkdtemp(prefix="ontschools-synthetic-")
+    try:
+        csv_path = os.path.join(directory, "active.csv")
+        rows, _ = synthetic.write_active(csv_path, args.scale)
+        print("synthetic file: %d rows, %.1f MB" % (rows, os.path.getsize(csv_path) / 2 ** 20))
+        print("%-7s %9s %12s %10s %10s" % ("path", "seconds", "max_rss_mb", "frame_mb", "rows"))
+        for path in PATHS:
+            out = subprocess.check_output([sys.executable, __file__, "--child", path, "--csv", csv_path], cwd=ROOT)
+            result = json.loads(out.decode().strip().splitlines()[-1])
+            print("%-7s %9.3f %12.1f %10.1f %10d" % (path, result["seconds"], result["max_rss_mb"], result["frame_mb"],
+                                                      result["rows"]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+## Requests per second for /_dash-layout with and without the layout cache
+##
+## Runs in-process through Flask's test client, so it measures the server's
+## CPU cost per request without any network in between. The data comes from
+## ONTSCHOOLS_CACHE_DIR (or a download when it is empty):
+##
+##     python benchmarks/layout_rps.py --requests 200
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(client, path, requests, headers):
+    status = None
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, headers=headers)
+        status = response.status_code
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, status, len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /_dash-layout endpoint.")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    import app
+    import config
+    if not app.refresher.wait_ready(timeout=300):
+        sys.exit("no data snapshot after 300s")
+    client = app.server.test_client()
+    path = app.app.config.routes_pathname_prefix + "_dash-layout"
+
+    config.LAYOUT_CACHE = True
+    etag = client.get(path, headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    cases = [
+        ("dash (uncached)", False, {}),
+        ("cached identity", True, {}),
+        ("cached gzip", True, {"Accept-Encoding": "gzip"}),
+        ("cached br", True, {"Accept-Encoding": "br"}),
+        ("cached 304", True, {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+    ]
+    print("%-18s %10s %7s %10s" % ("case", "req/s", "status", "bytes"))
+    for name, cached, headers in cases:
+        config.LAYOUT_CACHE = cached
+        rps, status, size = measure(client, path, args.requests, headers)
+        print("%-18s %10.1f %7d %10d" % (name, rps, status, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+## Offline benchmark of the whole pipeline and the served endpoints
+##
+## For each scale, synthetic data sets (see synthetic.py) are put in place as
+## the local snapshot of an empty cache directory and the app is imported in
+## a fresh interpreter, with the upstream URLs pointing at a closed port. The
+## first snapshot therefore goes through every stage from the local files:
+## parse, ingest, aggregate, series, transform, figure and layout. The stage
+## times come from the startup phases (see startup.py and metrics.py).
+## Each endpoint is then requested through Flask's test client: once cold,
+## and `--repeat` times warm.
+##
+## Every run appends one JSON line per scale to --out. --compare prints the
+## ratios against the last run of the same scale in another results file and
+## marks what got slower than --threshold:
+##
+##     python benchmarks/pipeline.py --scales 1 10 --out bench.jsonl
+##     python benchmarks/pipeline.py --scales 1 10 --compare bench.jsonl
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic
+
+NAMES = {"summary": synthetic.write_summary, "active": synthetic.write_active}
+
+
+def generate(data_dir, scale, seed):
+    """The synthetic files of one scale, written once and reused by later runs."""
+    directory = os.path.join(data_dir, "scale-%d-seed-%d" % (scale, seed))
+    done = os.path.join(directory, "DONE")
+    if not os.path.exists(done):
+        os.makedirs(directory, exist_ok=True)
+        for name, write in NAMES.items():
+            write(os.path.join(directory, name + ".csv"), scale, seed)
+        open(done, "w").close()
+    return directory
+
+
+def _sha256(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _timings(call, repeat):
+    start = time.perf_counter()
+    status = call()
+    first = time.perf_counter() - start
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        warm.append(time.perf_counter() - start)
+    warm.sort()
+    return {
+        "status": status,
+        "first": round(first, 6),
+        "median": round(warm[len(warm) // 2], 6) if warm else None,
+        "p95": round(warm[min(len(warm) - 1, int(len(warm) * 0.95))], 6) if warm else None,
+    }
+
+
+def _callback(client, output, inputs, changed=0):
+    ## The request the Dash renderer sends when inputs[changed] changes;
+    ## Dash passes them to the callback by position, so they keep its order.
+    ## `output` is "component.prop", or a list of them for a multi-output callback
+    if isinstance(output, list):
+        outputs = [dict(zip(("id", "property"), name.split("."))) for name in output]
+        output = ".." + "...".join(output) + ".."
+    else:
+        outputs = dict(zip(("id", "property"), output.split(".")))
+    payload = {
+        "output": output,
+        "outputs": outputs,
+        "inputs": [{"id": cid, "property": cprop, "value": value} for cid, cprop, value in inputs],
+        "changedPropIds": ["%s.%s" % inputs[changed][:2]],
+        "state": [],
+    }
+    return lambda: client.post("/_dash-update-component", json=payload).status_code
+
+
+def run_child(source, repeat):
+    cache_dir = tempfile.mkdtemp(prefix="ontschools-bench-")
+    os.environ.update({
+        "ONTSCHOOLS_CACHE_DIR": cache_dir,
+        "ONTSCHOOLS_SUMMARY_URL": "http://127.0.0.1:9/summary.csv",
+        "ONTSCHOOLS_ACTIVE_URL": "http://127.0.0.1:9/active.csv",
+        "ONTSCHOOLS_REFRESH_SECONDS": "3600",
+        "ONTSCHOOLS_RETRY_SECONDS": "3600",
+        "ONTSCHOOLS_SHARED_DIR": "",
+        "ONTSCHOOLS_FAST_BOOT": "0",
+    })
+    try:
+        from fetch import SnapshotCache
+        cache = SnapshotCache(cache_dir)
+        for name in NAMES:
+            path = os.path.join(source, name + ".csv")
+            shutil.copyfile(path, cache.path(name))
+            cache.store_meta(name, {"url": None, "etag": None, "last_modified": None,
+                                    "sha256": _sha256(path), "size": os.path.getsize(path)})
+
+        import app
+        import metrics
+        import startup
+        import views
+        if not app.refresher.wait_ready(timeout=3600):
+            raise SystemExit("no snapshot after an hour")
+        snapshot = app.refresher.current()
+        client = app.server.test_client()
+        layout = app.app.config.routes_pathname_prefix + "_dash-layout"
+        etag = client.get(layout, headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+        municipality = str(snapshot.active.latest.municipality.iloc[0])
+        school = views.school_options(snapshot)[0]["value"]
+
+        endpoints = {
+            "layout": lambda: client.get(layout, headers={"Accept-Encoding": "gzip"}).status_code,
+            "layout_304": lambda: client.get(layout, headers={"Accept-Encoding": "gzip",
+                                                              "If-None-Match": etag}).status_code,
+            "filtered_all": _callback(client, "filtered-graph.figure", [
+                ("filter-date", "date", None), ("filter-municipality", "value", None), ("filter-board", "value", None)]),
+            "filtered_municipality": _callback(client, "filtered-graph.figure", [
+                ("filter-date", "date", None), ("filter-municipality", "value", municipality),
+                ("filter-board", "value", None)]),
+            "trend": _callback(client, "trend-graph.figure", [
+                ("trend-series", "value", "new_total_school_related_cases"), ("trend-aggregation", "value", "7-day")]),
+            "summary_peak": _callback(client, "summary-graph.figure", [("kpi-reference", "value", "peak")]),
+            "school_table_sorted": _callback(client, ["school-table.data", "school-table.page_count",
+                                                      "school-table.page_current"], [
+                ("school-table", "page_current", 2), ("school-table", "page_size", 15),
+                ("school-table", "sort_by", [{"column_id": "municipality", "direction": "asc"}]),
+                ("filter-date", "date", None), ("filter-municipality", "value", None), ("filter-board", "value", None)]),
+            "school_table_filtered": _callback(client, ["school-table.data", "school-table.page_count",
+                                                        "school-table.page_current"], [
+                ("school-table", "page_current", 2), ("school-table", "page_size", 15), ("school-table", "sort_by", []),
+                ("filter-date", "date", None), ("filter-municipality", "value", municipality),
+                ("filter-board", "value", None)], changed=4),
+            "school_history": _callback(client, "school-history-graph.figure", [("school-select", "value", school)]),
+            "search": lambda: client.get("/_search?q=ecole+elem").status_code,
+            "metrics": lambda: client.get("/metrics").status_code,
+        }
+        ## The layout is encoded by the first request above, which is the "layout" startup phase
+        results = {name: _timings(call, repeat) for name, call in endpoints.items()}
+        print(json.dumps({
+            "rows": {"summary": len(snapshot.df_sum), "active": len(snapshot.active.history)},
+            "stages": startup.report()["phases"],
+            "endpoints": results,
+            "memory_mb": {kind[0]: round(value / 2 ** 20, 1) for kind, value in metrics.memory().items()},
+        }))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(result):
+    ## (section, name) -> seconds, the values two runs are compared on
+    values = {("stage", name): seconds for name, seconds in result["stages"].items()}
+    for name, timing in result["endpoints"].items():
+        values[("endpoint", name + ".first")] = timing["first"]
+        values[("endpoint", name + ".median")] = timing["median"]
+    return values
+
+
+def compare(result, baseline_path, threshold):
+    with open(baseline_path) as fh:
+        runs = [json.loads(line) for line in fh if line.strip()]
+    base = [run for run in runs if run["scale"] == result["scale"]]
+    if not base:
+        print("no baseline for scale %d in %s" % (result["scale"], baseline_path))
+        return 0
+    before, after = _flatten(base[-1]), _flatten(result)
+    slower = 0
+    print("%-9s %-32s %10s %10s %7s" % ("section", "name", "before", "after", "ratio"))
+    for key in sorted(after):
+        if key not in before or not before[key] or after[key] is None:
+            continue
+        ratio = after[key] / before[key]
+        flag = " slower" if ratio > threshold else ""
+        slower += bool(flag)
+        print("%-9s %-32s %10.4f %10.4f %6.2fx%s" % (key[0], key[1], before[key], after[key], ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage and endpoint on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", choices=sorted(synthetic.SCALES), default=[1, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "ontschools-synthetic"))
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results.jsonl"))
+    parser.add_argument("--compare", help="results file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="ratio above which a value counts as slower")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args.child, args.repeat)
+
+    slower = 0
+    for scale in args.scales:
+        source = generate(args.data_dir, scale, args.seed)
+        out = subprocess.check_output([sys.executable, __file__, "--child", source, "--repeat", str(args.repeat)],
+                                      cwd=ROOT)
+        result = json.loads(out.decode().strip().splitlines()[-1])
+        result.update({
+            "scale": scale,
+            "seed": args.seed,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        })
+        with open(args.out, "a") as fh:
+            fh.write(json.dumps(result, sort_keys=True) + "\n")
+
+        print("scale %d: %d summary rows, %d active rows, peak %.1f MB" % (
+            scale, result["rows"]["summary"], result["rows"]["active"], result["memory_mb"].get("peak", 0)))
+        for name, seconds in result["stages"].items():
+            print("  stage    %-24s %9.4f s" % (name, seconds))
+        for name, timing in result["endpoints"].items():
+            print("  endpoint %-24s first %9.4f s  median %9.4f s  (%s)" % (
+                name, timing["first"], timing["median"] or 0, timing["status"]))
+        if args.compare:
+            slower += compare(result, args.compare, args.threshold)
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
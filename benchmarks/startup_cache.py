@@ -0,0 +1,75 @@
+## Startup time and peak RSS: parsing the CSVs vs. loading the typed Parquet cache
+##
+## Each path runs in a fresh interpreter so imports, page cache aside, start
+## from the same state a new gunicorn worker would. Run it once the app has
+## populated ONTSCHOOLS_CACHE_DIR:
+##
+##     python benchmarks/startup_cache.py --repeat 5
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_csv():
+    import config
+    import data
+    df_sum = data.load_summary(os.path.join(config.CACHE_DIR, "summary.csv"))
+    df_active = data.load_active(os.path.join(config.CACHE_DIR, "active.csv"))
+    return df_sum, df_active
+
+
+def load_cache():
+    from store import ActiveStore, FrameCache
+    df_sum = FrameCache("summary").read()
+    df_active = ActiveStore().view().history
+    return df_sum, df_active
+
+
+PATHS = {"csv": load_csv, "cache": load_cache}
+
+
+def run_one(path):
+    start = time.perf_counter()
+    df_sum, df_active = PATHS[path]()
+    elapsed = time.perf_counter() - start
+    frames_mb = (df_sum.memory_usage(deep=True).sum() + df_active.memory_usage(deep=True).sum()) / 2 ** 20
+    print(json.dumps({
+        "path": path,
+        "seconds": round(elapsed, 4),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "frames_mb": round(frames_mb, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CSV parsing with the typed Parquet cache.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=sorted(PATHS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_one(args.child)
+
+    results = {path: [] for path in PATHS}
+    for _ in range(args.repeat):
+        for path in PATHS:
+            out = subprocess.check_output([sys.executable, __file__, "--child", path], cwd=ROOT)
+            results[path].append(json.loads(out.decode().strip().splitlines()[-1]))
+
+    print("%-6s %10s %12s %10s" % ("path", "seconds", "max_rss_mb", "frames_mb"))
+    for path, runs in results.items():
+        best = min(runs, key=lambda r: r["seconds"])
+        print("%-6s %10.3f %12.1f %10.1f" % (path, best["seconds"], best["max_rss_mb"], best["frames_mb"]))
+    csv, cache = (min(r["seconds"] for r in results[p]) for p in ("csv", "cache"))
+    print("cache speed-up: %.1fx" % (csv / cache))
+
+
+if __name__ == "__main__":
+    main()
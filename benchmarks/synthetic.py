@@ -0,0 +1,132 @@
+## Synthetic schoolcovidsummary.csv and schoolsactivecovid.csv
+##
+## Same columns, order and date format as the files on data.ontario.ca, with
+## reported days on school days only (weekdays from September to June, minus
+## the winter and March breaks) and French names with accents. A scale grows
+## both the number of school years and the number of schools:
+##
+##     scale   school years   schools    active rows (approx.)
+##     1       1              4,800      140,000
+##     10      2              24,000     1,400,000
+##     100     4              120,000    14,000,000
+##
+## The output only depends on the scale and the seed, so two runs of a
+## benchmark see the same bytes.
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_COLUMNS = [
+    "collected_date", "reported_date", "current_schools_w_cases", "current_schools_closed",
+    "current_total_number_schools", "new_total_school_related_cases", "new_school_related_student_cases",
+    "new_school_related_staff_cases", "new_school_related_unspecified_cases", "recent_total_school_related_cases",
+    "recent_school_related_student_cases", "recent_school_related_staff_cases",
+    "recent_school_related_unspecified_cases", "past_total_school_related_cases",
+    "past_school_related_student_cases", "past_school_related_staff_cases",
+    "past_school_related_unspecified_cases", "cumulative_school_related_cases",
+    "cumulative_school_related_student_cases", "cumulative_school_related_staff_cases",
+    "cumulative_school_related_unspecified_cases",
+]
+ACTIVE_COLUMNS = [
+    "collected_date", "reported_date", "school_id", "school_board", "school", "municipality",
+    "confirmed_student_cases", "confirmed_staff_cases", "confirmed_unspecified_cases", "total_confirmed_cases",
+]
+
+## scale -> (school years, multiple of the real number of schools)
+SCALES = {1: (1, 1), 10: (2, 5), 100: (4, 25)}
+SCHOOLS = 4800
+BOARDS = 72
+MUNICIPALITIES = 420
+## Share of schools reporting an active case on a given day
+ACTIVE_SHARE = 0.15
+
+
+def school_days(years, first_year=2020):
+    """Reported dates: weekdays of each school year, without the winter and March breaks."""
+    days = []
+    for year in range(first_year, first_year + years):
+        for day in pd.bdate_range(datetime.date(year, 9, 8), datetime.date(year + 1, 6, 29)):
+            if (day.month == 12 and day.day >= 21) or (day.month == 1 and day.day <= 1):
+                continue
+            if day.month == 3 and 15 <= day.day <= 19:
+                continue
+            days.append(day)
+    return pd.DatetimeIndex(days)
+
+
+def _schools(count, rng):
+    ids = np.arange(100000, 100000 + count)
+    boards = np.array(["Conseil scolaire catholique %d" % i if i % 4 == 0 else "District School Board %d" % i
+                       for i in range(BOARDS)], dtype=object)
+    municipalities = np.array(["Municipalité %d" % i if i % 5 == 0 else "Township %d" % i
+                               for i in range(MUNICIPALITIES)], dtype=object)
+    names = np.array(["École élémentaire catholique %d" % i if i % 3 == 0 else "Public School %d" % i
+                      for i in ids], dtype=object)
+    ## One school in fifty is a board office, which the app leaves out of the rankings
+    names[::50] = ["%s Board Site" % board for board in boards[rng.randint(0, BOARDS, len(names[::50]))]]
+    return pd.DataFrame({
+        "school_id": ids,
+        "school_board": boards[rng.randint(0, BOARDS, count)],
+        "school": names,
+        "municipality": municipalities[rng.randint(0, MUNICIPALITIES, count)],
+    })
+
+
+def write_active(path, scale=1, seed=0):
+    """Write the active-schools file; returns (rows, reported dates)."""
+    years, multiple = SCALES[scale]
+    rng = np.random.RandomState(seed)
+    schools = _schools(SCHOOLS * multiple, rng)
+    per_day = int(len(schools) * ACTIVE_SHARE)
+    days = school_days(years)
+    rows = 0
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        fh.write(",".join(ACTIVE_COLUMNS) + "\n")
+        for day in days:
+            today = schools.iloc[np.sort(rng.choice(len(schools), per_day, replace=False))].copy()
+            students = rng.poisson(1.2, per_day) + 1
+            staff = rng.poisson(0.3, per_day)
+            today.insert(0, "collected_date", (day + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+            today.insert(1, "reported_date", day.strftime("%Y-%m-%d"))
+            today["confirmed_student_cases"] = students
+            today["confirmed_staff_cases"] = staff
+            today["confirmed_unspecified_cases"] = 0
+            today["total_confirmed_cases"] = students + staff
+            today[ACTIVE_COLUMNS].to_csv(fh, header=False, index=False)
+            rows += per_day
+    return rows, days
+
+
+def write_summary(path, scale=1, seed=0):
+    """Write the summary file, one row per reported day; returns the number of rows."""
+    years, multiple = SCALES[scale]
+    rng = np.random.RandomState(seed + 1)
+    days = school_days(years)
+    total_schools = SCHOOLS * multiple
+    n = len(days)
+
+    new = {kind: rng.poisson(rate * multiple, n) for kind, rate in (("student", 90), ("staff", 25), ("unspecified", 5))}
+    df = pd.DataFrame({
+        "collected_date": (days + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        "reported_date": days.strftime("%Y-%m-%d"),
+        "current_schools_w_cases": np.full(n, int(total_schools * ACTIVE_SHARE)),
+        "current_schools_closed": rng.poisson(3 * multiple, n),
+        "current_total_number_schools": np.full(n, total_schools),
+    })
+    total = new["student"] + new["staff"] + new["unspecified"]
+    df["new_total_school_related_cases"] = total
+    for kind in ("student", "staff", "unspecified"):
+        df["new_school_related_%s_cases" % kind] = new[kind]
+    ## recent: the last 14 days, past: everything before that
+    for prefix, values in (("recent", lambda v: pd.Series(v).rolling(14, min_periods=1).sum()),
+                           ("past", lambda v: pd.Series(v).cumsum() - pd.Series(v).rolling(14, min_periods=1).sum())):
+        df["%s_total_school_related_cases" % prefix] = values(total).astype(int)
+        for kind in ("student", "staff", "unspecified"):
+            df["%s_school_related_%s_cases" % (prefix, kind)] = values(new[kind]).astype(int)
+    df["cumulative_school_related_cases"] = np.cumsum(total)
+    for kind in ("student", "staff", "unspecified"):
+        df["cumulative_school_related_%s_cases" % kind] = np.cumsum(new[kind])
+    df[SUMMARY_COLUMNS].to_csv(path, index=False)
+    return n
@@ -0,0 +1,128 @@
+## Worker count vs. memory, per-worker loading against shared mode
+##
+## Starts gunicorn with 1, 2, 4 and 8 workers in both modes, waits until every
+## worker serves data, then sums RSS and PSS (shared pages split between the
+## processes that map them) over the master, workers and loader.
+## Linux only (reads /proc). Uses the data already in ONTSCHOOLS_CACHE_DIR and
+## points the upstream URLs at a closed port, so it runs offline:
+##
+##     python benchmarks/worker_rss.py --workers 1 2 4 8
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Lines of gunicorn's log shown when a run fails to start
+LOG_LINES = 30
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as fh:
+            return [int(child) for child in fh.read().split()]
+    except OSError:
+        return []
+
+
+def _tree(pid):
+    pids = [pid]
+    for child in _children(pid):
+        pids.extend(_tree(child))
+    return pids
+
+
+def _memory_kb(pid):
+    rss = pss = 0
+    try:
+        with open("/proc/%d/smaps_rollup" % pid) as fh:
+            for line in fh:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def _wait_ready(proc, port, workers, timeout):
+    ## Hit the search endpoint until enough requests in a row are answered, or
+    ## gunicorn exits. It answers 503 until its worker holds a snapshot, where
+    ## the layout can be served from the fast-boot copy before any data loads.
+    deadline = time.monotonic() + timeout
+    ready = 0
+    url = "http://127.0.0.1:%d/_search?q=school" % port
+    while time.monotonic() < deadline and ready < workers * 4 and proc.poll() is None:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                resp.read()
+            ready += 1
+        except OSError:
+            ready = 0
+            time.sleep(0.5)
+    return ready >= workers * 4
+
+
+def run(workers, shared, timeout):
+    port = _free_port()
+    env = dict(os.environ)
+    env["ONTSCHOOLS_SUMMARY_URL"] = "http://127.0.0.1:9/summary.csv"
+    env["ONTSCHOOLS_ACTIVE_URL"] = "http://127.0.0.1:9/active.csv"
+    env["ONTSCHOOLS_REFRESH_SECONDS"] = "3600"
+    shared_dir = tempfile.mkdtemp(prefix="ontschools-shared-") if shared else ""
+    env["ONTSCHOOLS_SHARED_DIR"] = shared_dir
+    ## gunicorn's log goes to a file rather than a pipe nobody reads while waiting
+    log = tempfile.TemporaryFile(mode="w+")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+         "-b", "127.0.0.1:%d" % port, "app:server"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        if not _wait_ready(proc, port, workers, timeout):
+            reason = "exited with %d" % proc.returncode if proc.poll() is not None else "timed out"
+            log.seek(0)
+            print("gunicorn with %d workers %s, its last log lines:\n%s"
+                  % (workers, reason, "".join(log.readlines()[-LOG_LINES:])), file=sys.stderr)
+            return None
+        totals = [_memory_kb(pid) for pid in _tree(proc.pid)]
+        return sum(rss for rss, _ in totals) / 1024, sum(pss for _, pss in totals) / 1024
+    finally:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(30)
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory per worker count with and without shared mode.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print("%-8s %-8s %10s %10s" % ("workers", "mode", "rss_mb", "pss_mb"))
+    for workers in args.workers:
+        for shared in (False, True):
+            result = run(workers, shared, args.timeout)
+            mode = "shared" if shared else "per-wkr"
+            if result is None:
+                print("%-8d %-8s %10s %10s" % (workers, mode, "failed", "-"))
+            else:
+                print("%-8d %-8s %10.1f %10.1f" % (workers, mode, result[0], result[1]))
+
+
+if __name__ == "__main__":
+    main()
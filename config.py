@@ -0,0 +1,70 @@
+## Runtime settings for the Ontario Schools COVID-19 dashboard
+## Every setting can be overridden with an ONTSCHOOLS_* environment variable.
+
+import os
+
+
+def _env(name, default):
+    return os.environ.get("ONTSCHOOLS_" + name, default)
+
+
+def _env_int(name, default):
+    return int(_env(name, default))
+
+
+### Summary of COVID-19 Cases in Ontario Schools ***
+SUMMARY_URL = _env("SUMMARY_URL", "https://data.ontario.ca/dataset/b1fef838-8784-4338-8ef9-ae7cfd405b41/resource/7fbdbb48-d074-45d9-93cb-f7de58950418/download/schoolcovidsummary.csv")
+
+### Ontario Schols with Active Case Data set
+ACTIVE_URL = _env("ACTIVE_URL", "https://data.ontario.ca/dataset/b1fef838-8784-4338-8ef9-ae7cfd405b41/resource/8b6d22e2-7065-4b0f-966f-02640be366f2/download/schoolsactivecovid.csv")
+
+# Where both data sets are loaded from: "remote" (the two URLs above),
+# "dir:<directory>" holding summary.csv and active.csv, or the summary and
+# active tables of a database, "sqlite:<path>" or "duckdb:<path>" (see backends.py)
+DATA_BACKEND = _env("DATA_BACKEND", "remote")
+
+# Local directory for the raw snapshots of both data sets and their validators
+CACHE_DIR = _env("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+
+# Seconds to wait on data.ontario.ca before a download is abandoned
+FETCH_TIMEOUT = _env_int("FETCH_TIMEOUT", 30)
+
+# Retries of a failed download, and the base in seconds of their jittered exponential backoff
+FETCH_RETRIES = _env_int("FETCH_RETRIES", 3)
+FETCH_BACKOFF = float(_env("FETCH_BACKOFF", 2.0))
+
+# Failed fetches in a row after which a data set's upstream is left alone,
+# and for how many seconds, while the last good local copy is served
+BREAKER_FAILURES = _env_int("BREAKER_FAILURES", 3)
+BREAKER_SECONDS = _env_int("BREAKER_SECONDS", 600)
+
+# Seconds between two background refreshes of the upstream data sets
+REFRESH_SECONDS = _env_int("REFRESH_SECONDS", 900)
+
+# Seconds a failed refresh waits before it is retried
+RETRY_SECONDS = _env_int("RETRY_SECONDS", 60)
+
+# Rows parsed at a time when the active-schools CSV is ingested, which bounds
+# the memory a refresh needs on top of the compact history it builds
+INGEST_CHUNK_ROWS = _env_int("INGEST_CHUNK_ROWS", 100000)
+
+# Serve the Dash layout from a per-version, precompressed cache (set to 0 to disable)
+LAYOUT_CACHE = bool(_env_int("LAYOUT_CACHE", 1))
+
+# Serve the last encoded layout from the cache directory while a fresh process
+# loads its first snapshot, instead of the loading page (set to 0 to disable)
+FAST_BOOT = bool(_env_int("FAST_BOOT", 1))
+
+# When set, one loader process publishes the data into this directory and the
+# gunicorn workers attach to it read-only instead of loading it themselves
+SHARED_DIR = _env("SHARED_DIR", "")
+
+# Preprocessed municipality and health unit boundaries of the map view (see geo.py)
+GEO_DIR = _env("GEO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geo"))
+
+# Default output directory of the static export (export.py)
+EXPORT_DIR = _env("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "export"))
+
+# Bounds of each per-selection result cache of the interactive views
+MEMO_MAX_ENTRIES = _env_int("MEMO_MAX_ENTRIES", 512)
+MEMO_MAX_MB = _env_int("MEMO_MAX_MB", 64)
@@ -0,0 +1,213 @@
+## Building the dashboard figure from the derived frames
+##
+## Each panel of the figure is built by its own function that returns the
+## traces it adds as (trace, row, col). FigureBuilder memoizes every panel on
+## the content hashes of only the data sets that panel reads, so a refresh of
+## the active-schools data set reuses the summary panels as they are.
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import kpi
+
+
+def indicators_panel(df_sum, frames):
+    ## Deltas against the previous day; with_reference() switches them to another reference
+    kpis = frames["kpis"]
+    traces = []
+
+    traces.append((
+        go.Indicator(
+            name = "total",
+            value = kpis.at["total", "value"],
+            delta = {'reference': kpi.reference_value(kpis, "total"), 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
+            mode = "number+delta",
+            title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Reported Cases</span>"},
+        ),
+        1, 1))
+
+    traces.append((
+        go.Indicator(
+            name = "student",
+            value = kpis.at["student", "value"],
+            delta = {'reference': kpi.reference_value(kpis, "student"), 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
+            mode = "number+delta",
+            title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Student</span>"},
+            domain = {'row': 0, 'column': 2}),
+        1, 2))
+
+    traces.append((
+        go.Indicator(
+            mode = "number+delta",
+            name = "staff",
+            value = kpis.at["staff", "value"],
+            delta = {"reference": kpi.reference_value(kpis, "staff"), 'increasing' : {'color' : '#5DADE2' }, 'decreasing' : {'color' : 'crimson' }},
+            title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Staff</span>"},
+            domain = {'row': 0, 'column': 1}),
+        1, 3))
+
+    traces.append((
+        go.Indicator(
+            mode = 'number+delta',
+            name = "schools_w_cases",
+            value = kpis.at["schools_w_cases", "value"],
+            delta = {'reference' : kpi.reference_value(kpis, "schools_w_cases"), 'increasing' : {'color' : '#5DADE2' }},
+            title = {"text" : f" <br><span style = 'font-size: 0.7em; color:#294C63'>Schools with <br>Active Cases <br> ({frames['perc_school_cases']}% ONT)</span>"}),
+        1, 4))
+
+    traces.append((
+        go.Indicator(
+            mode = 'number+delta',
+            name = "schools_closed",
+            delta = {'reference' : kpi.reference_value(kpis, "schools_closed"), 'increasing' : {'color' : '#5DADE2' }},
+            value = kpis.at["schools_closed", "value"],
+            title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Schools Closed</span>"},
+            ),
+        1, 5))
+
+    traces.append((
+        go.Indicator(
+            mode = 'number+delta',
+            value = frames["schools_w_two_or_more"],
+            title = {"text" : " <br><span style = 'font-size: 0.7em; color:#294C63'>Schools with <br>at least 2 <br>Active Cases</span>"},
+        ),
+        1, 6))
+
+    traces.append((
+        go.Indicator(
+            mode = "gauge+number",
+            value = frames["school_days"],
+            title = {'text': f"<span style='font-size:0.7em; color:#294C63'> Schools Days Completed:<br> {frames['days_remain']} To Go </span>"},
+            gauge = {
+                'axis' : { 'range' : [0, frames["school_days_total"]]},
+                'bar' : {'color' : '#5DADE2'},
+                'threshold' : {'line' : {'color': "crimson", 'width' : 4}, 'thickness': 0.90, 'value' : frames["school_days_total"]}}
+
+        ),
+        5, 5))
+    return traces
+
+
+def cumulative_panel(df_sum, frames):
+    return [(
+        go.Scatter(
+            x = df_sum['reported_date'],
+            y = df_sum['cumulative_school_related_cases'],
+            mode = 'lines+markers',
+            marker = dict(size = 5,
+                          line = dict( width = 1.2, color = '#5DADE2'))
+        ),
+        2, 1)]
+
+
+def weekly_panel(df_sum, frames):
+    df_weekly = frames["df_weekly"]
+    return [(
+        go.Bar(y = df_weekly["Weekly Average COVID-19 Cases"], x = df_weekly["Start of Week"],
+               marker = dict(color = df_weekly["Weekly Average COVID-19 Cases"], coloraxis="coloraxis"),
+               text = df_weekly["Weekly Average COVID-19 Cases"],
+               textposition = 'outside'),
+        2, 4)]
+
+
+def municipalities_panel(df_sum, frames):
+    df_municipality_now = frames["df_municipality_now"]
+    return [(
+        go.Bar(y = df_municipality_now["total_confirmed_cases"], x = df_municipality_now["municipality"],
+               marker = dict(color = df_municipality_now["total_confirmed_cases"], coloraxis="coloraxis"),
+               text = df_municipality_now['total_confirmed_cases'],
+               textposition = 'outside'
+               ),
+        4, 1)]
+
+
+## Panel name -> (build function, data sets it reads)
+PANELS = {
+    "indicators": (indicators_panel, ("summary", "active")),
+    "cumulative": (cumulative_panel, ("summary",)),
+    "weekly": (weekly_panel, ("summary",)),
+    "municipalities": (municipalities_panel, ("active",)),
+}
+
+
+def _subplots(frames):
+    return make_subplots(
+            rows = 5, cols = 6, row_heights = [0.2, 0.2, 0.2, 0.2, 0.2],
+            #vertical_spacing=0.03,
+            specs = [
+                        [ {"type": "indicator"}, {"type": "indicator"}, {"type": "indicator"}, {"type" : "indicator"}, {"type" : "indicator"}, {"type" : "indicator"} ],
+                        [ {"type" : "scatter", "rowspan": 2, "colspan" : 3}, None, None, {"type" : "bar", "rowspan" : 2, "colspan" : 3}, None, None],
+                        [  None, None, None, None, None, None],
+                        [{"type" : "bar", "rowspan": 2, "colspan" : 4}, None, None, None, None, None],
+                        [  None, None, None, None, {"type": "indicator", "rowspan" : 1, "colspan" : 2}, None],
+                    ],
+         subplot_titles = ("","","","","","","Cumulative COVID-19 Cases","Weekly Average COVID-19 Cases",
+                           f"Confirmed COVID-19 Case Numbers in <br>Ontario Municipalities On:{frames['last_reported_date'].date()}", ""),
+    )
+
+
+def _update_layout(fig):
+    ####################################  UPDATE LAYOUT ########################################################
+
+    fig.update_layout(
+        template = "plotly_white",
+        title_x = 0.05,
+        title_font_color = '#3D92A8',
+        showlegend = False,
+        yaxis_title = "Cumulative Cases",
+        titlefont = dict(
+                size = 12))
+
+    fig['layout']['yaxis1'].update(automargin = True, range = [0, 8000], showgrid = True, gridcolor = 'lightgrey')
+    fig['layout']['yaxis2'].update(showgrid=True, showticklabels = False, range = [0, 300])
+    fig['layout']['yaxis3'].update(showgrid=True, showticklabels = False, range = [0, 900])
+    fig['layout']['xaxis1'].update(tickangle= 0, showgrid = False, automargin = False,
+                                    tickfont=dict(size = 11),
+                                    dtick = 'M1',
+                                    tickformat = "%b %d\n%y")
+    fig['layout']['xaxis3'].update(tickangle = -40, title = "Top 30 Municipalities",
+                                    tickfont=dict(size = 11))
+    fig['layout']['xaxis2'].update(tickangle = 0,
+                                   title_font_color = "#3D92A8",
+                                   tickfont=dict(size = 11),
+                                   dtick = 'M1',
+                                   tickformat = "%b %d\n%Y")
+
+    fig.update_layout(coloraxis=dict(colorscale="RdBu_r"))
+    fig.layout.update(showlegend=False)
+    fig.layout.coloraxis.update(showscale = False)
+
+
+class FigureBuilder(object):
+    """Assembles the figure from panels memoized on the hashes of their inputs."""
+
+    def __init__(self):
+        self._panels = {}
+        self.builds = {name: 0 for name in PANELS}
+
+    def panel(self, name, df_sum, frames, hashes):
+        build, inputs = PANELS[name]
+        key = tuple(hashes[data_set] for data_set in inputs)
+        cached = self._panels.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key, build(df_sum, frames))
+            self._panels[name] = cached
+            self.builds[name] += 1
+        return cached[1]
+
+    def build(self, df_sum, frames, hashes):
+        fig = _subplots(frames)
+        for name in PANELS:
+            for trace, row, col in self.panel(name, df_sum, frames, hashes):
+                fig.add_trace(trace, row = row, col = col)
+        _update_layout(fig)
+        return fig
+
+
+def with_reference(fig, kpis, reference):
+    """Figure dict of `fig` with the deltas of its KPI indicators taken against another kpi.REFERENCES entry."""
+    figure = fig.to_dict()
+    for trace in figure["data"]:
+        if trace.get("type") == "indicator" and trace.get("name") in kpis.index:
+            trace["delta"] = dict(trace.get("delta", {}), reference=kpi.reference_value(kpis, trace["name"], reference))
+    return figure
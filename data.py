@@ -0,0 +1,179 @@
+## Loading and transforming the Ontario Schools COVID-19 Data sets
+
+import io
+
+import numpy as np
+import pandas as pd
+
+import kpi
+import metrics
+import normalize
+import schoolyear
+from aggregates import AggregateIndex
+from config import SUMMARY_URL, ACTIVE_URL, INGEST_CHUNK_ROWS
+from timeseries import SeriesEngine
+
+
+## Explicit dtypes of the cleaned frames: categoricals for the repeated
+## strings and int32 for the case counts (float64 is kept when a column has gaps)
+ACTIVE_CATEGORIES = ["school_board", "school", "municipality"]
+ACTIVE_COUNTS = ["confirmed_student_cases", "confirmed_staff_cases", "confirmed_unspecified_cases", "total_confirmed_cases"]
+COUNT_DTYPE = "int32"
+
+
+def _compact_counts(df, columns):
+    for col in columns:
+        if col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype(COUNT_DTYPE)
+    return df
+
+
+def load_summary(source=SUMMARY_URL):
+    return clean_summary(pd.read_csv(source))
+
+
+def clean_summary(df_sum):
+    ## Change the 'reported_date' column to a datetime object and drop 'collected_date'
+    df_sum["reported_date"] = pd.to_datetime(df_sum["reported_date"])
+    df_sum.drop("collected_date", axis=1, inplace=True)
+    return _compact_counts(df_sum, df_sum.columns.drop("reported_date"))
+
+
+def load_active(source=ACTIVE_URL):
+    ## Detect the encoding instead of forcing latin-1, which turned French names into mojibake
+    raw = normalize.read_source(source)
+    df_active = pd.read_csv(io.BytesIO(raw), encoding=normalize.detect_encoding(raw),
+                            dtype={col: str for col in ACTIVE_CATEGORIES})
+    return clean_active(df_active)
+
+
+def iter_active(fh, encoding, names, chunk_rows=INGEST_CHUNK_ROWS):
+    """Cleaned active frames of at most `chunk_rows` rows, parsed from a binary file positioned after the header.
+
+    Only one chunk of raw strings is alive at a time, so the memory needed
+    does not grow with the size of the file.
+    """
+    text = io.TextIOWrapper(fh, encoding=encoding, newline="")
+    try:
+        for chunk in pd.read_csv(text, header=None, names=names, chunksize=chunk_rows,
+                                 dtype={col: str for col in ACTIVE_CATEGORIES}):
+            yield clean_active(chunk)
+    finally:
+        ## Leave `fh` open for the caller
+        text.detach()
+
+
+def clean_active(df_active):
+    df_active["reported_date"] = pd.to_datetime(df_active["reported_date"])
+
+    ## Drop collected_date from Active data set
+    df_active.drop("collected_date", axis=1, inplace=True)
+
+    for col in ACTIVE_CATEGORIES:
+        df_active[col] = df_active[col].astype("category")
+
+    ## Repair the names and apply name_fixes.csv, once per distinct name
+    with metrics.stage("normalize"):
+        normalize.normalize_names(df_active, ACTIVE_CATEGORIES)
+
+    ## Flag Board Site rows once, by testing each distinct school name rather than every row
+    codes = df_active.school.cat.codes.to_numpy()
+    board_sites = np.asarray(df_active.school.cat.categories.str.contains('Board'), dtype=bool)
+    df_active["is_board_site"] = (codes >= 0) & board_sites[codes] if len(board_sites) else False
+    return _compact_counts(df_active, ACTIVE_COUNTS)
+
+
+def concat_active(frames):
+    """pd.concat for cleaned active frames that keeps the string columns categorical."""
+    frames = [df for df in frames if len(df)]
+    if len(frames) <= 1:
+        return frames[0].reset_index(drop=True) if frames else None
+    ## New names are appended to the categories of the first frame, usually
+    ## the whole history, so its codes stay as they are and only frames whose
+    ## categories differ are recoded (and copied)
+    categories = {}
+    for col in ACTIVE_CATEGORIES:
+        merged = frames[0][col].cat.categories
+        for df in frames[1:]:
+            other = df[col].cat.categories
+            if not other.equals(merged):
+                merged = merged.append(other[~other.isin(merged)])
+        categories[col] = merged
+    aligned = []
+    for df in frames:
+        recoded = {col: df[col].cat.set_categories(merged) for col, merged in categories.items()
+                   if not df[col].cat.categories.equals(merged)}
+        aligned.append(df.assign(**recoded) if recoded else df)
+    return pd.concat(aligned, ignore_index=True)
+
+
+def build_frames(df_sum, active, series=None, aggregates=None):
+    """Derive every frame and number the dashboard shows.
+
+    `active` is the store.ActiveView of the active-schools data set for the
+    current school year, which already holds the latest reported day and the
+    per-school aggregates.
+    `series` are the timeseries.SeriesEngine results for df_sum; they are
+    computed from scratch when not given.
+    `aggregates` is an AggregateIndex of the latest day that a database
+    backend already computed in SQL; it is built from active.latest otherwise.
+    """
+    frames = {}
+
+    ## The Active Cases Data set for the last_reported date, without Board Sites
+    df_active_now = active.latest[~active.latest.is_board_site]
+    frames["df_active_now"] = df_active_now
+
+    ## One aggregation pass feeds the municipality and school rankings
+    if aggregates is None:
+        with metrics.stage("aggregate"):
+            aggregates = AggregateIndex(active.latest)
+    frames["aggregates"] = aggregates
+
+    ## Top 30 municipalities by active cases
+    frames["df_municipality_now"] = aggregates.top_municipalities(30)
+
+    ## Weekly and rolling averages of every new_* and current_* series
+    if series is None:
+        series = SeriesEngine().update(df_sum)
+    frames["series"] = series
+
+    ## Ontario Schools COVID-19 Cases Summary data set - Weekly Average
+    df_weekly = series["weekly"].new_total_school_related_cases.round().reset_index()
+    df_weekly.rename(columns= {"reported_date" : "Start of Week", "new_total_school_related_cases" : "Weekly Average COVID-19 Cases"}, inplace = True)
+    frames["df_weekly"] = df_weekly
+
+    ## Every KPI indicator of the latest day against the previous day, last week and the peak
+    frames["kpis"] = kpi.compute(df_sum)
+
+    # Schools with 2 or more cases
+    frames["df_schools_total_active_now"] = aggregates.schools
+    frames["schools_w_two_or_more"] = aggregates.schools_with_at_least(2)
+
+    total_schools_ont = max(df_sum.current_total_number_schools)
+    perc_school_cases = str(round(frames["kpis"].at["schools_w_cases", "value"] / total_schools_ont, 1) * 100)
+    if perc_school_cases[-1] == '0':
+        perc_school_cases = perc_school_cases[0:2]
+    frames["total_schools_ont"] = total_schools_ont
+    frames["perc_school_cases"] = perc_school_cases
+
+    ## School days of the current school year, counted on its calendar
+    last_reported_date = max(df_sum.reported_date)
+    calendar = schoolyear.SchoolCalendar(schoolyear.start_year_of(last_reported_date))
+    frames["school_year"] = schoolyear.label(calendar.year)
+    frames["school_days"] = calendar.days_through(last_reported_date)
+    frames["school_days_total"] = len(calendar)
+    frames["days_remain"] = frames["school_days_total"] - frames["school_days"]
+
+    # Top Schools with Active CASES
+    top_10_schools = aggregates.top_schools(25)
+    top_10_schools = top_10_schools.rename({"total_confirmed_cases" : "Active Cases", "school": "School"}, axis = 1)
+    top_10_schools.reset_index(inplace = True)
+    frames["top_10_schools"] = top_10_schools
+
+    # Number of schools in ONT with at least 1 confirmed case:
+    frames["schools_with_one_case"] = len(active.schools)
+
+    frames["last_reported_date"] = last_reported_date
+    frames["first_reported_date"] = min(df_sum.reported_date).date()
+    return frames
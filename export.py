@@ -0,0 +1,174 @@
+## Static export of the dashboard for a CDN or nginx
+##
+## Renders the main figure of the current data snapshot into a self-contained
+## index.html (plus .gz/.br variants for gzip_static / brotli_static), with
+## plotly.js written next to it under a content-hashed name or inlined, and
+## optionally a PNG of the figure. The data version is recorded in VERSION;
+## an export for a version that is already there is skipped, so it can run
+## from cron as often as needed:
+##
+##     python export.py --out /var/www/ontschools --png
+##     python export.py --out /var/www/ontschools --watch    # re-export on every new version
+
+import argparse
+import hashlib
+import html
+import logging
+import os
+import signal
+import threading
+
+import plotly
+
+import config
+import serialize
+from fetch import write_atomic
+from refresh import DataRefresher
+
+try:
+    import kaleido
+except ImportError:
+    # Only needed for --png
+    kaleido = None
+
+logger = logging.getLogger(__name__)
+
+VERSION_FILE = "VERSION"
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>ONT School COVID-19 Dashboard</title>
+{script}
+<style>
+body {{ margin: 0; background-color: #711411; font-family: Verdana; }}
+h1, h5, footer, p {{ text-align: center; color: lightgrey; }}
+h1 {{ padding-top: 25px; font-size: 220%; line-height: 1.2; margin-top: 30px; }}
+h5 {{ font-size: 25px; font-variant-caps: small-caps; }}
+#dashboard {{ height: 100vh; margin: 10px; }}
+a {{ color: lightgrey; }}
+table {{ margin: 20px auto; border-collapse: collapse; color: #154360; }}
+th {{ background-color: #5DADE2; padding: 4px 12px; }}
+td {{ background-color: #F5F5F5; padding: 4px 12px; }}
+tr:nth-child(odd) td {{ background-color: #A4CDE8; }}
+</style>
+</head>
+<body>
+<h1>COVID-19 CASES in  ONTARIO SCHOOLS</h1>
+<h5>UPDATED: {updated}</h5>
+<div id="dashboard"></div>
+{top_schools}
+{interactive}
+<footer>Created By: Peter Stangolis</footer>
+<p>Data obtained from the Ontario Governments website,
+<a href="https://data.ontario.ca/dataset/summary-of-cases-in-schools" target="_blank">Source</a></p>
+<script>
+Plotly.newPlot("dashboard", {figure}, {{"responsive": true}});
+</script>
+</body>
+</html>
+"""
+
+
+def exported_version(out):
+    path = os.path.join(out, VERSION_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return fh.read().strip()
+
+
+def _plotlyjs(out, mode):
+    """The <script> tag loading plotly.js, writing the asset to `out` when it is hashed."""
+    if mode == "cdn":
+        return '<script src="https://cdn.plot.ly/plotly-%s.min.js"></script>' % plotly.offline.get_plotlyjs_version()
+    source = plotly.offline.get_plotlyjs()
+    if mode == "inline":
+        return "<script>%s</script>" % source
+    payload = source.encode("utf-8")
+    name = "plotly-%s.min.js" % hashlib.sha256(payload).hexdigest()[:12]
+    if not os.path.exists(os.path.join(out, name)):
+        _write_variants(os.path.join(out, name), payload)
+    return '<script src="%s"></script>' % name
+
+
+def _write_variants(path, payload):
+    ## The body and its precompressed variants, so nginx never compresses on the fly
+    encoded = serialize.Encoded(payload)
+    suffixes = {None: "", "gzip": ".gz", "br": ".br"}
+    for encoding, (body, _) in encoded.variants.items():
+        write_atomic(path + suffixes[encoding], body)
+
+
+def _top_schools(frames):
+    ## The app pages through every school; the static page lists the top ones
+    rows = "".join("<tr><td>%s</td><td>%d</td></tr>" % (html.escape(str(row.School)), row[-1])
+                   for row in frames["top_10_schools"].itertuples(index=False))
+    return "<table><tr><th>SCHOOL</th><th>CASES</th></tr>%s</table>" % rows
+
+
+def export(snapshot, out, plotlyjs="hashed", png=False, app_url=None, force=False):
+    """Write the static bundle for `snapshot`; False when that version was already exported."""
+    os.makedirs(out, exist_ok=True)
+    if not force and exported_version(out) == snapshot.version:
+        return False
+
+    interactive = ""
+    if app_url:
+        interactive = '<p><a href="%s">Filters, trends and school history</a></p>' % html.escape(app_url, quote=True)
+    page = PAGE.format(
+        script=_plotlyjs(out, plotlyjs),
+        updated=snapshot.frames["last_reported_date"].date(),
+        interactive=interactive,
+        top_schools=_top_schools(snapshot.frames),
+        ## "</" would end the script element early
+        figure=serialize.dumps(snapshot.fig).decode("utf-8").replace("</", "<\\/"),
+    )
+    _write_variants(os.path.join(out, "index.html"), page.encode("utf-8"))
+
+    if png:
+        if kaleido is None:
+            raise RuntimeError("PNG export needs the kaleido package")
+        write_atomic(os.path.join(out, "dashboard.png"), snapshot.fig.to_image(format="png", width=1600, height=1200))
+
+    ## Written last: a bundle is only marked current once every file is in place
+    write_atomic(os.path.join(out, VERSION_FILE), snapshot.version.encode("ascii"))
+    logger.info("Exported snapshot %s to %s", snapshot.version, out)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the dashboard as a static HTML bundle.")
+    parser.add_argument("--out", default=config.EXPORT_DIR)
+    parser.add_argument("--plotlyjs", choices=["hashed", "inline", "cdn"], default="hashed")
+    parser.add_argument("--png", action="store_true", help="also render dashboard.png (needs kaleido)")
+    parser.add_argument("--app-url", help="link to the interactive Dash app")
+    parser.add_argument("--force", action="store_true", help="export even if this version already was")
+    parser.add_argument("--watch", action="store_true", help="keep running and export every new version")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s export %(levelname)s %(message)s")
+
+    refresher = DataRefresher()
+    if args.watch:
+        ## The refresher only publishes a snapshot when the data version changed
+        refresher.subscribe(lambda snapshot: export(snapshot, args.out, args.plotlyjs, args.png,
+                                                    args.app_url, args.force))
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+        refresher.start()
+        stopped.wait()
+        refresher.stop(timeout=10)
+        return
+
+    ## The first build may come from the local snapshot files, the second checks upstream
+    if not refresher.refresh_now():
+        raise SystemExit("Could not load the data sets")
+    refresher.refresh_now()
+    export(refresher.current(), args.out, args.plotlyjs, args.png, args.app_url, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+## Conditional download of the data sets with an on-disk snapshot cache
+##
+## Each data set is kept on disk as <name>.csv next to <name>.json, which holds
+## its validators (ETag, Last-Modified and the sha256 of the body). A fetch
+## sends If-None-Match / If-Modified-Since, and a 304 or an unchanged hash
+## keeps the stored sha256, so the caller can skip parsing altogether.
+##
+## Requests go through a keep-alive connection per host and thread. Timeouts,
+## connection errors, 5xx and 429 responses are retried with jittered
+## exponential backoff, and a per-data-set circuit breaker stops calling an
+## upstream that keeps failing, so the caller falls back to the local copy.
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+## A transport is any callable (url, headers, timeout) -> Response, so the
+## fetcher can be pointed at a local stand-in server or an in-memory fake.
+Response = namedtuple("Response", ["status", "headers", "body"])
+
+## Callers tell a change by meta["sha256"]
+FetchResult = namedtuple("FetchResult", ["name", "path", "meta"])
+
+
+class KeepAliveTransport(object):
+    """HTTP(S) transport that keeps one connection open per host and thread, following redirects."""
+
+    def __init__(self, max_redirects=5):
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+
+    def _connections(self):
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        return self._local.connections
+
+    def _request(self, parts, headers, timeout):
+        key = (parts.scheme, parts.netloc)
+        connections = self._connections()
+        reused = key in connections
+        if not reused:
+            cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            connections[key] = cls(parts.netloc, timeout=timeout)
+        conn = connections[key]
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        try:
+            conn.request("GET", path, headers=dict(headers, Connection="keep-alive"))
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            del connections[key]
+            if reused:
+                ## The server may have dropped the idle connection: one more try on a new one
+                return self._request(parts, headers, timeout)
+            raise
+        if resp.will_close:
+            conn.close()
+            del connections[key]
+        return resp, body
+
+    def __call__(self, url, headers, timeout):
+        for _ in range(self.max_redirects + 1):
+            resp, body = self._request(urllib.parse.urlsplit(url), headers, timeout)
+            location = resp.getheader("location")
+            if resp.status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return Response(resp.status, {k.lower(): v for k, v in resp.getheaders()}, body)
+        raise IOError("Too many redirects for %s" % url)
+
+
+class StatusError(IOError):
+    """Upstream answered with a status other than 200 or 304."""
+
+    def __init__(self, status, url):
+        IOError.__init__(self, "Unexpected HTTP status %s for %s" % (status, url))
+        self.status = status
+
+
+class CircuitOpenError(IOError):
+    """The circuit breaker of a data set is open: upstream is not called until it resets."""
+
+
+class CircuitBreaker(object):
+    """Opens after `failures` failed fetches in a row and lets one trial through every `reset_seconds`."""
+
+    def __init__(self, failures=None, reset_seconds=None, clock=time.monotonic):
+        self.failures = config.BREAKER_FAILURES if failures is None else failures
+        self.reset_seconds = config.BREAKER_SECONDS if reset_seconds is None else reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failed = 0
+        self._opened_at = None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at >= self.reset_seconds:
+                ## Half open: the next call is the trial, and a failure reopens it
+                self._opened_at = self._clock()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failed += 1
+            if self._failed >= self.failures:
+                self._opened_at = self._clock()
+
+
+def _retryable(exc):
+    if isinstance(exc, StatusError):
+        return exc.status >= 500 or exc.status == 429
+    return isinstance(exc, (OSError, http.client.HTTPException))
+
+
+def write_atomic(path, payload):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class SnapshotCache(object):
+    """Raw copies of the data sets and their validators in one local directory."""
+
+    def __init__(self, directory=None):
+        self.directory = config.CACHE_DIR if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".csv")
+
+    def meta(self, name):
+        meta_path = os.path.join(self.directory, name + ".json")
+        if not (os.path.exists(meta_path) and os.path.exists(self.path(name))):
+            return {}
+        with open(meta_path) as fh:
+            return json.load(fh)
+
+    def store(self, name, body, meta):
+        ## The body is replaced before its validators so a crash in between
+        ## only costs one extra download
+        write_atomic(self.path(name), body)
+        self.store_meta(name, meta)
+
+    def store_meta(self, name, meta):
+        write_atomic(os.path.join(self.directory, name + ".json"), json.dumps(meta).encode("utf-8"))
+
+
+class Fetcher(object):
+    """Downloads a data set only when it changed upstream."""
+
+    def __init__(self, cache=None, transport=None, timeout=None, retries=None, backoff=None):
+        self.cache = SnapshotCache() if cache is None else cache
+        self.transport = KeepAliveTransport() if transport is None else transport
+        self.timeout = config.FETCH_TIMEOUT if timeout is None else timeout
+        self.retries = config.FETCH_RETRIES if retries is None else retries
+        self.backoff = config.FETCH_BACKOFF if backoff is None else backoff
+        self.breakers = {}
+        self._sleep = time.sleep
+
+    def _breaker(self, name):
+        return self.breakers.setdefault(name, CircuitBreaker())
+
+    def _get(self, name, url, headers):
+        """One response, retrying transient failures with full-jitter exponential backoff."""
+        breaker = self._breaker(name)
+        if not breaker.allow():
+            raise CircuitOpenError("Circuit open for %s, not calling %s" % (name, url))
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.transport(url, headers, self.timeout)
+                if resp.status not in (200, 304):
+                    raise StatusError(resp.status, url)
+                breaker.success()
+                return resp
+            except Exception as exc:
+                if attempt == self.retries or not _retryable(exc):
+                    breaker.failure()
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                logger.warning("Fetching %s failed (%s), retry %d in %.1fs", name, exc, attempt + 1, delay)
+                metrics.FETCHES.inc(name, "retry")
+                self._sleep(delay)
+
+    def cached(self, name):
+        """The local snapshot of a data set, or None when nothing was stored yet."""
+        meta = self.cache.meta(name)
+        if not meta:
+            return None
+        return FetchResult(name, self.cache.path(name), meta)
+
+    def fetch(self, name, url):
+        meta = self.cache.meta(name)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            resp = self._get(name, url, headers)
+        except CircuitOpenError:
+            metrics.FETCHES.inc(name, "circuit_open")
+            raise
+        except Exception:
+            metrics.FETCHES.inc(name, "error")
+            raise
+        if resp.status == 304:
+            logger.info("%s not modified upstream", name)
+            metrics.FETCHES.inc(name, "not_modified")
+            return FetchResult(name, self.cache.path(name), meta)
+
+        new_meta = {
+            "url": url,
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+            "sha256": hashlib.sha256(resp.body).hexdigest(),
+            "size": len(resp.body),
+        }
+        if new_meta["sha256"] == meta.get("sha256"):
+            ## Same bytes under new validators: keep the file, refresh the validators
+            logger.info("%s unchanged (identical hash)", name)
+            self.cache.store_meta(name, new_meta)
+            metrics.FETCHES.inc(name, "unchanged")
+            return FetchResult(name, self.cache.path(name), new_meta)
+
+        self.cache.store(name, resp.body, new_meta)
+        logger.info("%s changed upstream (%d bytes)", name, len(resp.body))
+        metrics.FETCHES.inc(name, "changed")
+        return FetchResult(name, self.cache.path(name), new_meta)
@@ -0,0 +1,320 @@
+## Municipality and public health unit boundaries for the map view
+##
+## Boundaries are preprocessed offline, once, from any GeoJSON file of
+## polygons in longitude/latitude, e.g. Statistics Canada's census
+## subdivisions of Ontario and the Ministry of Health's health unit boundaries:
+##
+##     python geo.py health_unit phu_boundaries.geojson --name-property PHU_NAME
+##     python geo.py municipality csd_ontario.geojson --name-property CSDNAME
+##
+## Each layer is written to config.GEO_DIR/<layer>.json.gz. Coordinates are
+## quantized to a 16-bit grid over the layer's bounding box, every ring is
+## simplified (Douglas-Peucker) once per zoom level in LEVELS, and rings are
+## stored as delta-encoded integers. Features are keyed on the folded,
+## name-fixed name: the same form key() gives the `municipality` column, so
+## the data joins on names as they are shown. Each municipality carries the
+## key of the health unit its centroid falls in (build the health_unit layer
+## first); health unit totals are the sums of their municipalities.
+##
+## The app serves one level of a layer as GeoJSON at /_geo/<layer>/<level>.json,
+## encoded once and cached by the browser for good. Figures only hold that URL,
+## so the geometry is downloaded once per client, not with every figure.
+
+import argparse
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+import config
+import normalize
+import serialize
+from search import fold
+
+## Layer -> label of the map control, in the order offered
+LAYERS = [
+    ("municipality", "Municipalities"),
+    ("health_unit", "Public health units"),
+]
+
+## Simplification tolerance of each zoom level, in degrees (about 2 km, 500 m and 100 m)
+LEVELS = (0.02, 0.005, 0.001)
+
+## Geo projection scales from which the next, more detailed level is used
+LEVEL_SCALES = (4, 16)
+
+QUANTIZE = (1 << 16) - 1
+
+
+def key(name, column="municipality"):
+    """Join key of a name: repaired, name fixes of `column` applied, then folded."""
+    return fold(normalize.name_fixer(column)(name))
+
+
+def level_for_scale(scale, levels=len(LEVELS)):
+    return min(bisect.bisect_right(LEVEL_SCALES, scale), levels - 1)
+
+
+## Offline preprocessing
+
+def _polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+def _simplify(points, tolerance):
+    """Douglas-Peucker over an open polyline of (n, 2) points."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        inner = points[first + 1:last] - points[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            middle = first + 1 + i
+            keep[middle] = True
+            stack.extend([(first, middle), (middle, last)])
+    return points[keep]
+
+
+def _simplify_ring(ring, tolerance):
+    ## A closed ring is split at the vertex farthest from its first one, so
+    ## both halves have distinct ends; None when it collapses below a triangle
+    if len(ring) > 1 and (ring[0] == ring[-1]).all():
+        ring = ring[:-1]
+    if len(ring) < 3:
+        return None
+    far = int(np.argmax(np.hypot(*(ring - ring[0]).T)))
+    if far == 0:
+        return None
+    simplified = np.vstack([_simplify(ring[:far + 1], tolerance)[:-1],
+                            _simplify(np.vstack([ring[far:], ring[:1]]), tolerance)])
+    return simplified if len(simplified) >= 4 else None
+
+
+def _area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2.0
+
+
+def _centroid(polygons):
+    ## Area centroid of the outer ring of the largest polygon
+    ring = max((np.asarray(polygon[0], dtype=np.float64) for polygon in polygons), key=lambda r: abs(_area(r)))
+    x, y = ring[:, 0], ring[:, 1]
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = cross.sum() / 2.0
+    if area == 0:
+        return x.mean(), y.mean()
+    return ((x[:-1] + x[1:]) * cross).sum() / (6 * area), ((y[:-1] + y[1:]) * cross).sum() / (6 * area)
+
+
+def _contains(polygons, x, y):
+    ## Even-odd ray casting over every ring, so holes count out
+    inside = False
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for polygon in polygons:
+            for ring in polygon:
+                ring = np.asarray(ring, dtype=np.float64)
+                xi, yi, xj, yj = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+                crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+                inside ^= bool(np.count_nonzero(crosses) % 2)
+    return inside
+
+
+def _encode(ring):
+    return np.vstack([ring[:1], np.diff(ring, axis=0)]).ravel().tolist()
+
+
+def build_layer(layer, features, name_property, health_units=None):
+    """The compact form of a layer from GeoJSON features; `health_units` is a loaded health_unit GeoLayer."""
+    by_key = {}
+    fix = normalize.name_fixer(layer)
+    for feature in features:
+        name = fix(feature["properties"][name_property])
+        entry = by_key.setdefault(fold(name), {"name": name, "polygons": []})
+        entry["polygons"].extend(_polygons(feature["geometry"]))
+
+    coordinates = np.array([point[:2] for entry in by_key.values() for polygon in entry["polygons"]
+                            for ring in polygon for point in ring], dtype=np.float64)
+    translate = coordinates.min(axis=0)
+    scale = float((coordinates.max(axis=0) - translate).max()) / QUANTIZE or 1.0
+
+    compact = []
+    for feature_key, entry in sorted(by_key.items()):
+        levels = []
+        for tolerance in LEVELS:
+            polygons = []
+            for polygon in entry["polygons"]:
+                rings = [_simplify_ring(np.round((np.asarray(ring, dtype=np.float64)[:, :2] - translate) / scale)
+                                        .astype(np.int64), tolerance / scale) for ring in polygon]
+                if rings[0] is not None:
+                    polygons.append([_encode(ring) for ring in rings if ring is not None])
+            if not polygons:
+                ## Too small for this level: its largest outer ring as it is, so it stays on the map
+                outer = max((polygon[0] for polygon in entry["polygons"]), key=len)
+                polygons = [[_encode(np.round((np.asarray(outer, dtype=np.float64)[:, :2] - translate) / scale)
+                                     .astype(np.int64))]]
+            levels.append(polygons)
+        feature = {"id": feature_key, "name": entry["name"], "levels": levels}
+        if health_units is not None:
+            x, y = _centroid(entry["polygons"])
+            feature["health_unit"] = health_units.locate(x, y)
+        compact.append(feature)
+    return {"layer": layer, "translate": translate.tolist(), "scale": scale, "levels": list(LEVELS),
+            "features": compact}
+
+
+def write_layer(compact, directory=None):
+    directory = config.GEO_DIR if directory is None else directory
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, compact["layer"] + ".json.gz")
+    body = json.dumps(compact, separators=(",", ":")).encode("utf-8")
+    with open(path + ".tmp", "wb") as fh:
+        fh.write(gzip.compress(body, 9))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+## Serving
+
+class GeoLayer(object):
+    """One preprocessed layer, decoded to GeoJSON per level on first use."""
+
+    def __init__(self, path):
+        with open(path, "rb") as fh:
+            raw = fh.read()
+        ## Part of the geometry URLs, so browsers can cache them for good
+        self.version = hashlib.sha1(raw).hexdigest()[:16]
+        compact = json.loads(gzip.decompress(raw).decode("utf-8"))
+        self.name = compact["layer"]
+        self.levels = len(compact["levels"])
+        self._translate = np.asarray(compact["translate"], dtype=np.float64)
+        self._scale = compact["scale"]
+        self._features = compact["features"]
+        self.names = {feature["id"]: feature["name"] for feature in self._features}
+        self.health_units = {feature["id"]: feature.get("health_unit") for feature in self._features}
+        self._lock = threading.Lock()
+        self._encoded = {}
+
+    def _ring(self, deltas):
+        points = np.cumsum(np.asarray(deltas, dtype=np.int64).reshape(-1, 2), axis=0) * self._scale + self._translate
+        return np.round(points, 5)
+
+    def _polygons(self, feature, level):
+        return [[self._ring(ring) for ring in polygon] for polygon in feature["levels"][level]]
+
+    def geojson(self, level):
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "id": feature["id"],
+                "properties": {"name": feature["name"]},
+                "geometry": {"type": "MultiPolygon",
+                             "coordinates": [[ring.tolist() for ring in polygon]
+                                             for polygon in self._polygons(feature, level)]},
+            } for feature in self._features],
+        }
+
+    def encoded(self, level):
+        """serialize.Encoded GeoJSON of one level, built once."""
+        with self._lock:
+            if level not in self._encoded:
+                self._encoded[level] = serialize.Encoded(serialize.dumps(self.geojson(level)))
+            return self._encoded[level]
+
+    def locate(self, x, y):
+        """Key of the feature containing the point, at the most detailed level, or None."""
+        for feature in self._features:
+            if _contains(self._polygons(feature, self.levels - 1), x, y):
+                return feature["id"]
+        return None
+
+
+_layers = None
+_layers_lock = threading.Lock()
+
+
+def layers():
+    """{layer: GeoLayer} of the layers offered on the map, loaded from config.GEO_DIR once.
+
+    Health units are only offered with the municipality layer, which maps
+    municipalities to them.
+    """
+    global _layers
+    with _layers_lock:
+        if _layers is None:
+            found = {}
+            for layer, _ in LAYERS:
+                path = os.path.join(config.GEO_DIR, layer + ".json.gz")
+                if os.path.exists(path):
+                    found[layer] = GeoLayer(path)
+            if "municipality" not in found:
+                found.pop("health_unit", None)
+            _layers = found
+        return _layers
+
+
+def totals(layer, names, values):
+    """(keys, labels, totals, unmatched names) of the features of `layer` from municipality totals."""
+    available = layers()
+    municipalities = available["municipality"]
+    sums = {}
+    unmatched = []
+    for name, value in zip(names, values):
+        feature = key(name)
+        if feature not in municipalities.names:
+            unmatched.append(name)
+            continue
+        if layer == "health_unit":
+            feature = municipalities.health_units.get(feature)
+            if feature is None:
+                unmatched.append(name)
+                continue
+        sums[feature] = sums.get(feature, 0) + value
+    keys = sorted(sums)
+    return keys, [available[layer].names[k] for k in keys], [sums[k] for k in keys], unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess boundary polygons into a compact map layer.")
+    parser.add_argument("layer", choices=[layer for layer, _ in LAYERS])
+    parser.add_argument("geojson", help="GeoJSON file of the boundaries, in longitude/latitude")
+    parser.add_argument("--name-property", required=True, help="feature property holding the name")
+    parser.add_argument("--out", default=config.GEO_DIR)
+    args = parser.parse_args()
+
+    health_units = None
+    if args.layer == "municipality":
+        path = os.path.join(args.out, "health_unit.json.gz")
+        if os.path.exists(path):
+            health_units = GeoLayer(path)
+        else:
+            print("no health_unit layer in %s: municipalities will not be mapped to health units" % args.out)
+    with open(args.geojson, encoding="utf-8") as fh:
+        features = json.load(fh)["features"]
+    compact = build_layer(args.layer, features, args.name_property, health_units)
+    path = write_layer(compact, args.out)
+    print("%s: %d features, %.1f KB" % (path, len(compact["features"]), os.path.getsize(path) / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+## gunicorn settings
+##
+## In shared mode (ONTSCHOOLS_SHARED_DIR is set) the master starts one loader
+## process that downloads and builds the data for every worker; the workers
+## only attach to what it publishes.
+##
+## gunicorn reads every module-level name of this file as a setting, and
+## `config` is one of them, so the app's config module is imported in the
+## hooks rather than at the top.
+
+import os
+import subprocess
+import sys
+
+_loader = None
+
+
+def on_starting(server):
+    global _loader
+    import config
+    if config.SHARED_DIR:
+        loader = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loader.py")
+        _loader = subprocess.Popen([sys.executable, loader])
+        server.log.info("Started data loader (pid %s) for %s", _loader.pid, config.SHARED_DIR)
+
+
+def on_exit(server):
+    if _loader is not None:
+        _loader.terminate()
+        try:
+            _loader.wait(10)
+        except subprocess.TimeoutExpired:
+            _loader.kill()
@@ -0,0 +1,66 @@
+## Per-school case history index for drill-down
+##
+## All rows of the active history are laid out once per data version, grouped
+## by a stable school id and sorted by date within each school, in one
+## contiguous array per column. offsets[i]:offsets[i + 1] is the history of
+## the i-th school, so a lookup costs the length of that school's history
+## instead of a scan of the whole table.
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+HISTORY_COLUMNS = ["total_confirmed_cases", "confirmed_student_cases", "confirmed_staff_cases"]
+NAME_COLUMNS = ["school", "municipality", "school_board"]
+
+
+def _hashed_id(board, school, municipality):
+    key = "|".join(str(part) for part in (board, school, municipality))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def school_ids(df):
+    """A stable id per row: the upstream school_id, or a hash of board, school and municipality."""
+    if "school_id" in df.columns:
+        return df["school_id"].astype(str).to_numpy()
+    ## Hash each distinct (board, school, municipality) once, not every row
+    group = df.groupby(["school_board", "school", "municipality"], observed=True, sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(group, return_index=True)
+    names = df[["school_board", "school", "municipality"]].iloc[first_rows].to_numpy()
+    keys = np.array([_hashed_id(*name) for name in names], dtype=object)
+    return keys[group]
+
+
+class SchoolHistoryIndex(object):
+    """Dates and case counts of every school, contiguous per school."""
+
+    def __init__(self, history):
+        codes, self.ids = pd.factorize(school_ids(history))
+        dates = history.reported_date.to_numpy()
+        order = np.lexsort((dates.view("i8"), codes))
+
+        self.dates = dates[order]
+        self.cases = {col: history[col].to_numpy()[order] for col in HISTORY_COLUMNS}
+        counts = np.bincount(codes, minlength=len(self.ids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._positions = {school_id: i for i, school_id in enumerate(self.ids)}
+
+        ## Names from the latest row of each school
+        last_rows = order[self.offsets[1:] - 1]
+        self.names = {col: history[col].to_numpy()[last_rows] for col in NAME_COLUMNS}
+
+    def __contains__(self, school_id):
+        return school_id in self._positions
+
+    def describe(self, school_id):
+        """(school, municipality, school_board) of a school id."""
+        i = self._positions[school_id]
+        return tuple(self.names[col][i] for col in NAME_COLUMNS)
+
+    def get(self, school_id):
+        """The case history of one school as a frame indexed by reported date."""
+        i = self._positions[school_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        frame = {col: values[start:end] for col, values in self.cases.items()}
+        return pd.DataFrame(frame, index=pd.DatetimeIndex(self.dates[start:end], name="reported_date"))
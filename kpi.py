@@ -0,0 +1,61 @@
+## KPI indicators of the summary data set and their references
+##
+## Every indicator is a column of df_sum, shown for the latest reported day
+## and compared against a reference:
+##
+##     previous_day   the reported day before it
+##     last_week      the same weekday a week earlier, or the last day reported before that
+##     peak           the highest value of every earlier day
+##
+## compute() takes the indicator columns as one (days x indicators) array and
+## finds every reference with a row lookup and a column-wise max, instead of
+## one .loc lookup per indicator and day. The table is part of the frames of
+## a snapshot, so it is computed once per data version.
+
+import numpy as np
+import pandas as pd
+
+## Indicator -> df_sum column, in the order of the dashboard
+INDICATORS = [
+    ("total", "new_total_school_related_cases"),
+    ("student", "new_school_related_student_cases"),
+    ("staff", "new_school_related_staff_cases"),
+    ("schools_w_cases", "current_schools_w_cases"),
+    ("schools_closed", "current_schools_closed"),
+]
+
+## Reference -> label of the control that picks it
+REFERENCES = [
+    ("previous_day", "Previous day"),
+    ("last_week", "Same day last week"),
+    ("peak", "Peak"),
+]
+DEFAULT_REFERENCE = "previous_day"
+
+WEEK = np.timedelta64(7, "D")
+
+
+def compute(df_sum):
+    """Frame indexed by indicator: the latest `value` and one column per reference (NaN when there is none)."""
+    values = df_sum[[column for _, column in INDICATORS]].to_numpy(dtype="float64")
+    dates = df_sum.reported_date.to_numpy()
+    missing = np.full(values.shape[1], np.nan)
+
+    def row(i):
+        return values[i] if i >= 0 else missing
+
+    table = {
+        "value": values[-1],
+        "previous_day": row(len(values) - 2),
+        "last_week": row(np.searchsorted(dates, dates[-1] - WEEK, side="right") - 1),
+        ## fmax skips the gaps of a column instead of returning NaN for it
+        "peak": np.fmax.reduce(values[:-1], axis=0) if len(values) > 1 else missing,
+    }
+    return pd.DataFrame(table, index=[name for name, _ in INDICATORS],
+                        columns=["value"] + [name for name, _ in REFERENCES])
+
+
+def reference_value(kpis, indicator, reference=DEFAULT_REFERENCE):
+    """The reference of one indicator as a plain number, or None, ready for a figure."""
+    value = kpis.at[indicator, reference]
+    return None if np.isnan(value) else float(value)
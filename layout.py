@@ -0,0 +1,267 @@
+## Page layout of the dashboard for one data snapshot
+
+import dash_core_components as dcc
+import dash_html_components as html
+import dash_table
+
+## views and timeseries (pandas) are imported by the functions that render a
+## loaded snapshot, so the loading page can be served before pandas is imported
+
+
+LOADING_MESSAGE = "Loading the latest data from the Ontario Government, please refresh in a moment."
+
+
+## Rows per page of the schools table
+SCHOOL_TABLE_PAGE_SIZE = 15
+
+CONTROL_STYLE = {'display' : 'inline-block', 'width' : '30%', 'margin-right' : '2%', 'vertical-align' : 'top'}
+
+
+def kpi_controls():
+    ## What the deltas of the KPI indicators compare the latest day with
+    from kpi import DEFAULT_REFERENCE, REFERENCES
+    return html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px', 'color' : 'lightgrey'}, children = [
+        dcc.RadioItems(id = "kpi-reference", value = DEFAULT_REFERENCE, labelStyle = {'display' : 'inline-block', 'margin-right' : '15px'},
+                       options = [{"label": label, "value": name} for name, label in REFERENCES]),
+    ])
+
+
+def map_controls():
+    ## Choropleth of the latest day, when boundaries were preprocessed (geo.py)
+    import geo
+    available = geo.layers()
+    if not available:
+        return html.Div()
+    return html.Div(children = [
+        html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px', 'color' : 'lightgrey'}, children = [
+            dcc.RadioItems(id = "map-layer", value = geo.LAYERS[0][0], labelStyle = {'display' : 'inline-block', 'margin-right' : '15px'},
+                           options = [{"label": label, "value": layer} for layer, label in geo.LAYERS if layer in available]),
+        ]),
+        dcc.Graph(
+            id = "map-graph",
+            style = {'height':"70vh",
+                    'margin-bottom' : '20px',
+                    'margin-left' : '10px',
+                    'margin-right' : '10px'},
+            config = {'responsive': True},
+            ),
+    ])
+
+
+def filter_controls(snapshot):
+    ## Reported date, municipality and school board selection for the filtered graph
+    import views
+    index = views.filter_index(snapshot)
+    first, last = index.dates[0].date(), index.dates[-1].date()
+    return html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px'}, children = [
+        html.Div(style = CONTROL_STYLE, children = [
+            dcc.DatePickerSingle(id = "filter-date", min_date_allowed = first, max_date_allowed = last,
+                                 date = last, initial_visible_month = last, display_format = "MMM D, YYYY"),
+        ]),
+        html.Div(style = CONTROL_STYLE, children = [
+            dcc.Dropdown(id = "filter-municipality", placeholder = "All municipalities",
+                         options = [{"label": name, "value": name} for name in index.municipalities]),
+        ]),
+        html.Div(style = CONTROL_STYLE, children = [
+            dcc.Dropdown(id = "filter-board", placeholder = "All school boards",
+                         options = [{"label": name, "value": name} for name in index.boards]),
+        ]),
+    ])
+
+
+def trend_controls(snapshot):
+    ## Which summary series to plot and how to average it
+    import views
+    from timeseries import AGGREGATIONS
+    columns = list(snapshot.frames["series"]["weekly"].columns)
+    return html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px'}, children = [
+        html.Div(style = CONTROL_STYLE, children = [
+            dcc.Dropdown(id = "trend-series", clearable = False, value = "new_total_school_related_cases",
+                         options = [{"label": views.series_label(col), "value": col} for col in columns]),
+        ]),
+        html.Div(style = dict(CONTROL_STYLE, color = 'lightgrey'), children = [
+            dcc.RadioItems(id = "trend-aggregation", value = "weekly", labelStyle = {'display' : 'inline-block', 'margin-right' : '15px'},
+                           options = [{"label": name.capitalize(), "value": name} for name in AGGREGATIONS]),
+        ]),
+    ])
+
+
+def school_table(snapshot):
+    ## The schools of the filter selection, one page at a time; a click on a row shows its history
+    import views
+    from ranking import COLUMNS
+    return html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px'}, children = [
+        dash_table.DataTable(
+            id = "school-table",
+            columns = [{"name": label, "id": column} for column, label in COLUMNS],
+            page_current = 0,
+            page_size = SCHOOL_TABLE_PAGE_SIZE,
+            page_count = views.school_ranking(snapshot).page_count(SCHOOL_TABLE_PAGE_SIZE),
+            page_action = "custom",
+            sort_action = "custom",
+            sort_mode = "single",
+            sort_by = [],
+            style_header = {'backgroundColor' : '#5DADE2', 'color' : '#154360', 'fontWeight' : 'bold'},
+            style_cell = {'backgroundColor' : '#F5F5F5', 'color' : '#154360', 'textAlign' : 'left', 'font-family': 'Verdana'},
+            style_data_conditional = [{'if' : {'row_index' : 'odd'}, 'backgroundColor' : '#A4CDE8'}],
+        ),
+    ])
+
+
+def school_controls(snapshot):
+    ## Drill-down into the case history of one school
+    import views
+    return html.Div(style = {'margin-left' : '30px', 'margin-right' : '30px', 'margin-top' : '10px'}, children = [
+        html.Div(style = dict(CONTROL_STYLE, width = '62%'), children = [
+            dcc.Dropdown(id = "school-select", placeholder = "Select a school to see its case history",
+                         options = views.school_options(snapshot)),
+        ]),
+    ])
+
+
+def render_layout(snapshot):
+    if snapshot is None:
+        return html.Div(style = {'backgroundColor':'#711411', 'font-family': 'Verdana', 'margin-bottom' : '20px'}, children = [
+            html.H1(children = "COVID-19 CASES in  ONTARIO SCHOOLS",
+                    style = {'textAlign' : 'center', 'color' : 'lightgrey', 'padding-top' : '25px'}),
+            html.H5(children = LOADING_MESSAGE,
+                    style = {'textAlign' : 'center', 'color' : 'lightgrey'}),
+        ], className = 'ten columns offset-by-one')
+
+    return html.Div(style = {'backgroundColor':'#711411', 'font-family': 'Verdana', 'margin-bottom' : '20px'}, children = [
+        html.H1(children = "COVID-19 CASES in  ONTARIO SCHOOLS",
+                style = {
+                    'textAlign' : 'center',
+                    'color' : 'lightgrey',
+                    'padding-top' : '25px',
+                    'padding-bottom' : '0px',
+                    'font-size' : '220%',
+                    'height' : '60px',
+                    'line-height': 1.2,
+                    'margin-top' : '30px',
+                    'font-family':'Monaca',
+                    'font-weight' : 'bold'
+                }),
+
+        #title = {'text': f"<span style='font-size:0.8em; color:#294C63'> Schools Days Completed:<br> {days_remain} To Go </span>"},
+        html.H5(children =   f"UPDATED: {snapshot.frames['last_reported_date'].date()}",
+                style = {
+                    'textAlign' : 'center',
+                    'color' : '#5DADE2',
+                    'color' : 'lightgrey',
+                    'padding-top' : '0px',
+                    'font-size' : '25px',
+                    'font-family':'Monaca',
+                    'height' : '20px',
+                    'line-height': 1.1,
+                    'font-weight' : 'bold',
+                    #'background-color' : 'lightblue'
+                    'font-variant-caps': 'small-caps'}),
+
+        # html.Div(style={"backgroundColor":'white'}, children = [
+        #     dcc.Markdown('''f"* **{schools_with_one_case}** schools have had at least 1 confirmed COVID-19 case out of **{total_schools_ont}** schools in Ontario",
+        #                  f"* **{perc_school_cases}%** of Ontario schools have at least 1 active case",''',
+        #
+        #             style = {"color" : "black",
+        #                     "padding-top" : "40px",
+        #                     "margin-left": "70px",
+        #                     "margin-top" : '10px',
+        #                     #"font-weight" : 'bold',
+        #                     "font-size" : "15px",
+        #                     "height" : "20px",
+        #                     #"backgroundColor" : "white"}),
+        #                     #"border-top" : '2px solid red'
+        #                     }),
+            #dcc.Markdown("test"),
+
+        kpi_controls(),
+
+        dcc.Graph(
+            id = "summary-graph",
+            style = {'height':"100vh",
+                    'margin-bottom' : '20px',
+                    'margin-left' : '10px',
+                    'margin-right' : '10px',
+                    'margin-top' : '10px'},
+            config = {'responsive': True},
+            figure = snapshot.fig,
+            ),
+
+        map_controls(),
+
+        filter_controls(snapshot),
+
+        dcc.Graph(
+            id = "filtered-graph",
+            style = {'height':"70vh",
+                    'margin-bottom' : '20px',
+                    'margin-left' : '10px',
+                    'margin-right' : '10px'},
+            config = {'responsive': True},
+            ),
+
+        school_table(snapshot),
+
+        # html.P(children = '"Source:" <a ref> "https://data.ontario.ca/dataset/summary-of-cases-in-schools" target="_blank">  Schools COVID-19 Data</a>',
+        #                   style = {
+        #                       'textAlign' : 'right',
+        #                       'color' : 'lightgrey',
+        #                       'font' : 'Lucida Handwriting',
+        #                       'font-size' : '13',
+        #                       'font-style' : 'italic',
+        #                       'font-weight' : 'bold',
+        #                       'margin-bottom' : '10px',
+        #                       'margin-left' : '10x'
+        #                   }),
+
+        trend_controls(snapshot),
+
+        dcc.Graph(
+            id = "trend-graph",
+            style = {'height':"50vh",
+                    'margin-bottom' : '20px',
+                    'margin-left' : '10px',
+                    'margin-right' : '10px'},
+            config = {'responsive': True},
+            ),
+
+        school_controls(snapshot),
+
+        dcc.Graph(
+            id = "school-history-graph",
+            style = {'height':"50vh",
+                    'margin-bottom' : '20px',
+                    'margin-left' : '10px',
+                    'margin-right' : '10px'},
+            config = {'responsive': True},
+            ),
+
+        html.Footer("Created By: Peter Stangolis",
+                     style = {
+                         'textAlign' : 'left',
+                         'color' : 'lightgrey',
+                         'font' : 'Lucida Handwriting',
+                         'font-size' : '12',
+                         #'font-style' : 'italic',
+                         #'font-weight' : 'bold',
+                         'margin-bottom' : '10px',
+                         'margin-left' : '30px'
+                     }),
+        html.Label("Data obtained from the Ontario Governments website",
+                style = {
+                    'textAlign' : 'left',
+                    'color' : 'lightgrey',
+                    'font-stye' : 'italic',
+                    'margin-left' : '30px'
+                }),
+        html.A("Source", href="https://data.ontario.ca/dataset/summary-of-cases-in-schools",
+                target="_blank",
+                style = {
+                    'textAlign' : 'left',
+                    'color' : 'lightgrey',
+                    'font-stye' : 'italic',
+                    'margin-left' : '30px'
+                }
+                ),
+    ], className = 'ten columns offset-by-one'
+    )
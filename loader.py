@@ -0,0 +1,43 @@
+## Loader process for shared mode
+##
+## Runs the refresher once for the whole gunicorn deployment and publishes
+## every snapshot into ONTSCHOOLS_SHARED_DIR for the workers to attach to.
+## gunicorn.conf.py starts it from the master; it can also be run on its own:
+##
+##     ONTSCHOOLS_SHARED_DIR=/tmp/ontschools python loader.py
+
+import logging
+import os
+import signal
+import threading
+
+import config
+import serialize
+import shared
+from layout import render_layout
+from refresh import DataRefresher
+
+
+def publish(snapshot):
+    shared.publish(snapshot, config.SHARED_DIR, serialize.dumps(render_layout(snapshot)))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s loader %(levelname)s %(message)s")
+    if not config.SHARED_DIR:
+        raise SystemExit("ONTSCHOOLS_SHARED_DIR is not set")
+    os.makedirs(config.SHARED_DIR, exist_ok=True)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+
+    refresher = DataRefresher()
+    refresher.subscribe(publish)
+    refresher.start()
+    stopped.wait()
+    refresher.stop(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+## Bounded memoization for results that depend on the data version
+##
+## An LRUCache holds results for the current data version only: the first
+## lookup with a new version drops everything from the previous one. Entries
+## are evicted least recently used first once either the entry count or the
+## estimated memory cap is reached. Every cache registers itself in CACHES so
+## its counters can be read from one place.
+
+import sys
+import threading
+from collections import OrderedDict
+
+import metrics
+
+CACHES = {}
+
+
+def estimate_size(value):
+    """Approximate number of bytes held by a cached value."""
+    if hasattr(value, "memory_usage"):
+        ## DataFrame (one value per column) or Series; duck-typed so pandas is not imported at boot
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class LRUCache(object):
+    """LRU cache bounded by entries and bytes, cleared whenever the data version changes."""
+
+    def __init__(self, name, max_entries, max_bytes, sizeof=estimate_size):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        CACHES[name] = self
+
+    def _invalidate(self, version):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._version = version
+
+    def get(self, version, key, compute):
+        """The cached value for `key` under `version`, computing and storing it on a miss."""
+        with self._lock:
+            if version != self._version:
+                self._invalidate(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        ## Computed outside the lock so one slow selection does not block the others
+        value = compute()
+        size = self._sizeof(value)
+        with self._lock:
+            if version != self._version or size > self.max_bytes:
+                return value
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _cache_stats():
+    return {(name, stat): value for name, cache in CACHES.items() for stat, value in cache.stats().items()}
+
+
+metrics.Gauge("ontschools_cache", "Entries, bytes, limits and hit/miss/eviction counts of the memoized views.",
+              ["cache", "stat"], collect=_cache_stats)
+
+
+class VersionedValue(object):
+    """One value derived from a snapshot, rebuilt only when the data version changes."""
+
+    def __init__(self, build):
+        self._build = build
+        self._lock = threading.Lock()
+        self._entry = (None, None)
+
+    def get(self, snapshot):
+        version, value = self._entry
+        if version == snapshot.version:
+            return value
+        with self._lock:
+            version, value = self._entry
+            if version != snapshot.version:
+                value = self._build(snapshot)
+                self._entry = (snapshot.version, value)
+            return value
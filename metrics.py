@@ -0,0 +1,184 @@
+## Counters and timings of the data pipeline, in the Prometheus text format
+##
+## Kept dependency-free and cheap enough to leave on: recording a value is a
+## dict lookup and an addition under a per-metric lock. Every metric lives in
+## the process that records it, so with several gunicorn workers each worker
+## reports its own requests (shared mode: the loader does the pipeline work).
+## app.py serves render() at /metrics.
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import startup
+
+try:
+    import resource
+except ImportError:
+    # Windows: no peak memory
+    resource = None
+
+REGISTRY = []
+
+## Upper bounds in seconds, from a cache hit to a full download
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{%s}" % ",".join('%s="%s"' % (name, value) for (name, _), value in zip(pairs, escaped))
+
+
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.type)]
+        lines.extend("%s%s %s" % (name, labels, _number(value)) for name, labels, value in self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.label_names, key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value set directly, or read from `collect()` -> {label values: value} at render time."""
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        _Metric.__init__(self, name, documentation, labels)
+        self._collect = collect
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self):
+        if self._collect is not None:
+            items = sorted(self._collect().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [(self.name, _labels(self.label_names, key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        _Metric.__init__(self, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def totals(self):
+        """{label values: (count, sum)} of everything observed so far."""
+        with self._lock:
+            return {key: (sum(counts), total) for key, (counts, total) in self._values.items()}
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", _labels(self.label_names, key, [("le", _number(bound))]), cumulative))
+            samples.append((self.name + "_sum", _labels(self.label_names, key), total))
+            samples.append((self.name + "_count", _labels(self.label_names, key), cumulative))
+        return samples
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("ontschools_stage_seconds", "Time spent in each stage of the data pipeline.", ["stage"])
+REFRESHES = Counter("ontschools_refreshes_total", "Snapshot refreshes by outcome.", ["result"])
+FETCHES = Counter("ontschools_fetches_total", "Upstream downloads by data set and outcome.", ["name", "result"])
+INGESTED_ROWS = Counter("ontschools_ingested_rows_total", "Active-school rows ingested into the store.", ["mode"])
+REQUEST_SECONDS = Histogram("ontschools_request_seconds", "Latency of the Dash endpoints.", ["endpoint", "status"])
+
+
+@contextmanager
+def stage(name):
+    """Time one pipeline stage; the first run also counts as a startup phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        startup.record(name, elapsed)
+
+
+def memory():
+    """{(kind,): bytes} of the resident and peak resident memory of this process."""
+    values = {}
+    if resource is not None:
+        ## ru_maxrss is in kilobytes on Linux
+        values[("peak",)] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open("/proc/self/statm") as fh:
+            values[("resident",)] = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return values
+
+
+MEMORY = Gauge("ontschools_process_memory_bytes", "Resident and peak resident memory of this process.", ["kind"],
+               collect=memory)
@@ -0,0 +1,136 @@
+## Encoding detection and table-driven name normalization
+##
+## Names are fixed on the categories of the categorical columns, never row by
+## row: each distinct name is repaired and matched once, and the column is
+## remapped through its category codes. The cost grows with the number of
+## distinct names and table entries, not with the number of rows.
+
+import codecs
+import csv
+import io
+import os
+import re
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+NAME_FIXES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "name_fixes.csv")
+
+## Candidate encodings, in the order they are tried
+ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+
+## Characters that show up when UTF-8 text was decoded as latin-1 / cp1252
+_MOJIBAKE = re.compile("[ÃÂ]")
+
+
+def detect_encoding(raw):
+    """The first encoding in ENCODINGS that decodes `raw` without errors."""
+    for encoding in ENCODINGS:
+        try:
+            raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return ENCODINGS[-1]
+
+
+def detect_file_encoding(fh, start=0, block=1 << 20):
+    """detect_encoding for the bytes of an open binary file from `start` on, one block at a time."""
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        fh.seek(start)
+        try:
+            for chunk in iter(lambda: fh.read(block), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return ENCODINGS[-1]
+
+
+def read_source(source):
+    """The raw bytes of a path, URL or in-memory source, so its encoding can be detected."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, io.BytesIO):
+        return source.getvalue()
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source) as resp:
+            return resp.read()
+    with open(source, "rb") as fh:
+        return fh.read()
+
+
+def repair_mojibake(name):
+    """Undo UTF-8 text that was decoded with a single-byte encoding, when it can be."""
+    if not isinstance(name, str) or not _MOJIBAKE.search(name):
+        return name
+    for encoding in ("cp1252", "latin-1"):
+        try:
+            return name.encode(encoding).decode("utf-8")
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            continue
+    return name
+
+
+def load_name_fixes(path=NAME_FIXES_PATH):
+    """column -> [(match, name), ...] from the name fixes table."""
+    fixes = {}
+    with open(path, encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            fixes.setdefault(row["column"], []).append((row["match"], row["name"]))
+    return fixes
+
+
+class NameFixer(object):
+    """Renames every value containing a table entry's `match` to its `name`."""
+
+    def __init__(self, fixes):
+        ## Alternation takes the first alternative that matches at a position,
+        ## so sorting longest first gives the longest entry starting there; the
+        ## lookahead matches at every position, overlapping matches included
+        fixes = sorted(fixes, key=lambda fix: len(fix[0]), reverse=True)
+        self._names = dict(fixes)
+        self._pattern = re.compile("(?=(%s))" % "|".join(re.escape(match) for match, _ in fixes)) if fixes else None
+
+    def __call__(self, name):
+        """The name of the longest entry found anywhere in `name`, so a more specific entry wins."""
+        if self._pattern is None or not isinstance(name, str):
+            return name
+        found = max((match.group(1) for match in self._pattern.finditer(name)), key=len, default=None)
+        return self._names[found] if found is not None else name
+
+
+def remap_categories(series, fix):
+    """Apply `fix` to each category of a categorical Series, merging categories that collide."""
+    categories = series.cat.categories
+    fixed = np.array([fix(name) for name in categories], dtype=object)
+    if len(fixed) == 0:
+        return series
+    uniques, inverse = np.unique(fixed, return_inverse=True)
+    codes = series.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, inverse[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, uniques), index=series.index, name=series.name)
+
+
+_NAME_FIXERS = None
+
+
+def name_fixer(column):
+    """The repair and name fixes of `column` as one function of a single name."""
+    global _NAME_FIXERS
+    if _NAME_FIXERS is None:
+        _NAME_FIXERS = {col: NameFixer(fixes) for col, fixes in load_name_fixes().items()}
+    fixer = _NAME_FIXERS.get(column)
+    if fixer is None:
+        return repair_mojibake
+    return lambda name: fixer(repair_mojibake(name))
+
+
+def normalize_names(df, columns):
+    """Repair the encoding of, and apply the name fixes table to, categorical columns."""
+    for column in columns:
+        df[column] = remap_categories(df[column], name_fixer(column))
+    return df
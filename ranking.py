@@ -0,0 +1,70 @@
+## Ranked index of the schools with active cases, paged for the schools table
+##
+## The table shows the schools of the filter controls' selection: the latest
+## day of every municipality and school board until a filter is picked.
+##
+## The table asks for one page at a time (DataTable with custom paging and
+## sorting), so only the visible rows are ever sent. Every sortable column
+## gets its ascending and descending row order once per selection; a page
+## is then a slice of the presorted order, whatever the sort.
+
+import numpy as np
+import pandas as pd
+
+from history import school_ids
+from search import fold
+
+## Column -> header of the table, in display order
+COLUMNS = [
+    ("school", "School"),
+    ("municipality", "Municipality"),
+    ("school_board", "School Board"),
+    ("total_confirmed_cases", "Active Cases"),
+    ("confirmed_student_cases", "Student"),
+    ("confirmed_staff_cases", "Staff"),
+]
+TEXT_COLUMNS = ["school", "municipality", "school_board"]
+
+
+class SchoolRanking(object):
+    """The schools of the rows of one reported day, board sites excluded, ranked by active cases."""
+
+    def __init__(self, day):
+        rows = day[~day.is_board_site]
+        frame = pd.DataFrame({"id": school_ids(rows)})
+        for column, _ in COLUMNS:
+            values = rows[column]
+            frame[column] = values.astype(str).to_numpy() if column in TEXT_COLUMNS else values.to_numpy()
+        ## The default order is the ranking itself
+        self.frame = frame.sort_values("total_confirmed_cases", ascending=False, kind="mergesort") \
+            .drop_duplicates("id").reset_index(drop=True)
+
+        self._orders = {}
+        for column, _ in COLUMNS:
+            if column in TEXT_COLUMNS:
+                ## Accent- and case-insensitive, like the search
+                keys = np.array([fold(name) for name in self.frame[column]], dtype=object)
+                ascending = np.argsort(keys, kind="mergesort")
+                descending = ascending[::-1]
+            else:
+                keys = self.frame[column].to_numpy()
+                ascending = np.argsort(keys, kind="mergesort")
+                descending = np.argsort(-keys, kind="mergesort")
+            self._orders[(column, "asc")] = ascending
+            self._orders[(column, "desc")] = descending
+
+    def __len__(self):
+        return len(self.frame)
+
+    def page_count(self, size):
+        return max(1, -(-len(self.frame) // size))
+
+    def page(self, page, size, sort_by=None):
+        """Records of one page, sorted by the first DataTable sort_by entry (the ranking without one)."""
+        start = max(page, 0) * size
+        positions = slice(start, start + size)
+        if sort_by:
+            order = self._orders.get((sort_by[0]["column_id"], sort_by[0]["direction"]))
+            if order is not None:
+                positions = order[positions]
+        return self.frame.iloc[positions].to_dict("records")
@@ -0,0 +1,151 @@
+## Background refresh of the data sets, derived frames and figure
+##
+## A refresh runs on its own thread: it fetches both data sets, derives the
+## frames and builds the figure, and only then publishes a new Snapshot with a
+## single reference assignment. Readers call current() and get either the old
+## snapshot or the new one, never a half-built one, and never wait on a download.
+
+import hashlib
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import config
+import metrics
+import startup
+
+logger = logging.getLogger(__name__)
+
+
+Snapshot = namedtuple("Snapshot", ["version", "hashes", "loaded_at", "df_sum", "active", "frames", "fig"])
+
+
+def snapshot_version(hashes):
+    """A short version id derived from the content hashes of both data sets."""
+    joined = "|".join(hashes[name] for name in sorted(hashes))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:16]
+
+
+class SnapshotBuilder(object):
+    """Builds a Snapshot from a data-source backend, skipping work when nothing changed.
+
+    The backend (see backends.py, config.DATA_BACKEND) loads both data sets
+    and only re-reads the ones whose content changed; the builder derives the
+    series, frames and figure from them.
+    """
+
+    def __init__(self, backend=None):
+        ## pandas, pyarrow and plotly's subplots are imported here, on the
+        ## refresher thread, so importing the app does not wait for them
+        with startup.phase("imports_data"):
+            import backends
+            import dashboard
+            from timeseries import SeriesEngine
+        self.backend = backends.from_config() if backend is None else backend
+        self.figure_builder = dashboard.FigureBuilder()
+        self.series_engine = SeriesEngine()
+
+    def __call__(self, previous):
+        import data
+        loaded = self.backend.load(previous)
+        if loaded is None:
+            return None
+        df_sum, hashes = loaded.df_sum, loaded.hashes
+
+        with metrics.stage("series"):
+            series = self.series_engine.update(df_sum)
+        with metrics.stage("transform"):
+            frames = data.build_frames(df_sum, loaded.active, series, loaded.aggregates)
+        with metrics.stage("figure"):
+            fig = self.figure_builder.build(df_sum, frames, hashes)
+        return Snapshot(snapshot_version(hashes), hashes, time.time(), df_sum, loaded.active, frames, fig)
+
+
+class DataRefresher(object):
+    """Rebuilds snapshots off the request path and swaps them in atomically."""
+
+    def __init__(self, build=None, interval=None, retry_interval=None):
+        ## The default builder is created by the first refresh, off the importing thread
+        self._build = build
+        self._interval = config.REFRESH_SECONDS if interval is None else interval
+        self._retry_interval = config.RETRY_SECONDS if retry_interval is None else retry_interval
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """Call `listener(snapshot)` on the refresher thread after each publish."""
+        self._listeners.append(listener)
+
+    def current(self):
+        """The latest published snapshot, or None before the first load finishes."""
+        return self._snapshot
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def refresh_now(self):
+        """Build and publish a new snapshot on the calling thread.
+
+        Returns True when the build succeeded, including when it found
+        nothing new to publish, and False when it failed, in which case the
+        previous snapshot stays in place.
+        """
+        with self._refresh_lock:
+            previous = self._snapshot
+            try:
+                if self._build is None:
+                    self._build = SnapshotBuilder()
+                snapshot = self._build(previous)
+            except Exception:
+                logger.exception("Data refresh failed, keeping snapshot %s",
+                                 previous.version if previous is not None else None)
+                metrics.REFRESHES.inc("failed")
+                return False
+            if snapshot is None:
+                metrics.REFRESHES.inc("unchanged")
+                return True
+            metrics.REFRESHES.inc("published")
+            self._snapshot = snapshot
+            self._ready.set()
+            logger.info("Published data snapshot %s", snapshot.version)
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception:
+                    logger.exception("Snapshot listener %r failed", listener)
+            return True
+
+    def trigger(self):
+        """Ask the background thread to refresh right away."""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="data-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        ## The first snapshot may come from local files, so check upstream right after it
+        first = True
+        while not self._stop.is_set():
+            ok = self.refresh_now()
+            if first and ok:
+                first = False
+                continue
+            self._wake.wait(self._interval if ok else self._retry_interval)
+            self._wake.clear()
@@ -0,0 +1,90 @@
+## Ontario school years and their instructional calendars
+##
+## A school year runs from September to June and is named by the year it
+## starts in (2020 for 2020-2021); July and August belong to the year that is
+## ending. The calendar follows the rules of Ontario Regulation 304: classes
+## start the day after Labour Day and end by June 30, without the
+## statutory holidays, a two-week winter break that includes Christmas and New
+## Year's Day, and the March break. Boards place their PA days differently, so
+## they are counted as school days, as the data set reports on them.
+
+import datetime
+
+import numpy as np
+
+## First month of a school year; July and August still count towards the previous one
+FIRST_MONTH = 9
+
+
+def start_year(year, month):
+    """School year (by starting year) of a calendar year and month; works on numpy arrays."""
+    return year - (month < FIRST_MONTH)
+
+
+def start_year_of(date):
+    return start_year(date.year, date.month)
+
+
+def label(year):
+    return "%d-%d" % (year, year + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    ## n-th (1-based) `weekday` (Monday = 0) of a month
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _easter(year):
+    ## Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return datetime.date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+class SchoolCalendar(object):
+    """The instructional days of one school year."""
+
+    def __init__(self, year):
+        self.year = year
+        first = _nth_weekday(year, 9, 0, 1) + datetime.timedelta(days=1)
+        last = datetime.date(year + 1, 6, 30)
+
+        christmas = datetime.date(year, 12, 25)
+        ## Two weeks from the Monday of Christmas week, or from the 26th when Christmas is a Sunday
+        winter = christmas - datetime.timedelta(days=christmas.weekday()) if christmas.weekday() < 6 \
+            else christmas + datetime.timedelta(days=1)
+        second_friday = _nth_weekday(year + 1, 3, 4, 2)
+        easter = _easter(year + 1)
+        victoria = datetime.date(year + 1, 5, 24) - datetime.timedelta(days=datetime.date(year + 1, 5, 24).weekday())
+
+        closed = {
+            _nth_weekday(year, 10, 0, 2),                     # Thanksgiving
+            _nth_weekday(year + 1, 2, 0, 3),                  # Family Day
+            easter - datetime.timedelta(days=2),              # Good Friday
+            easter + datetime.timedelta(days=1),              # Easter Monday
+            victoria,                                         # Victoria Day
+        }
+        closed.update(winter + datetime.timedelta(days=i) for i in range(14))
+        closed.update(second_friday + datetime.timedelta(days=3 + i) for i in range(5))
+
+        days = []
+        day = first
+        while day <= last:
+            if day.weekday() < 5 and day not in closed:
+                days.append(day)
+            day += datetime.timedelta(days=1)
+        self.days = np.array(days, dtype="datetime64[D]")
+
+    def __len__(self):
+        return len(self.days)
+
+    def days_through(self, date):
+        """Number of school days up to and including `date`."""
+        return int(np.searchsorted(self.days, np.datetime64(date, "D"), side="right"))
@@ -0,0 +1,85 @@
+## Type-ahead search over school and municipality names
+##
+## Names are folded once per data version (mojibake repaired, accents and
+## case dropped, punctuation collapsed to spaces) and every name is indexed
+## by its character trigrams. A query is folded the same way and looked up
+## gram by gram: candidates are counted with one bincount over the posting
+## lists of its grams, so the cost follows the number of matching names, not
+## the number of rows or names in the data set.
+
+import re
+import unicodedata
+
+import numpy as np
+
+from normalize import repair_mojibake
+
+GRAM = 3
+
+## Fraction of the query's grams a name must contain to be returned at all
+MIN_SCORE = 0.5
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def fold(text):
+    """Lower-case ASCII form of a name, for accent- and encoding-insensitive matching."""
+    text = unicodedata.normalize("NFKD", repair_mojibake(str(text)))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def grams(folded, partial=False):
+    """Distinct trigrams of a folded name, padded so word starts and ends are grams of their own.
+
+    With `partial` the end is left open, so a query still being typed matches
+    every name its last word is the start of.
+    """
+    padded = " " + folded if partial else " " + folded + " "
+    return {padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)}
+
+
+class SearchIndex(object):
+    """Trigram index over (kind, label, value) entries."""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._folded = [fold(label) for _, label, _ in self.entries]
+        postings = {}
+        for i, folded in enumerate(self._folded):
+            for gram in grams(folded):
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    @classmethod
+    def from_history(cls, index):
+        """Every school of a SchoolHistoryIndex and every municipality they are in."""
+        schools = index.names["school"]
+        municipalities = index.names["municipality"]
+        entries = [("school", "%s (%s)" % (school, municipality), school_id)
+                   for school_id, school, municipality in zip(index.ids, schools, municipalities)]
+        entries.extend(("municipality", name, name) for name in sorted(set(map(str, municipalities))))
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=10, kind=None):
+        """[(score, (kind, label, value)), ...] best match first."""
+        folded = fold(query)
+        if not folded:
+            return []
+        query_grams = grams(folded, partial=True)
+        hits = [self._postings[gram] for gram in query_grams if gram in self._postings]
+        if not hits:
+            return []
+        scores = np.bincount(np.concatenate(hits), minlength=len(self.entries)) / float(len(query_grams))
+        candidates = np.flatnonzero(scores >= MIN_SCORE)
+        if kind is not None:
+            candidates = [i for i in candidates if self.entries[i][0] == kind]
+
+        ## Names containing the query as typed rank first, then by score and shorter names
+        def rank(i):
+            return (folded not in self._folded[i], -scores[i], len(self._folded[i]))
+        best = sorted(candidates, key=rank)[:limit]
+        return [(round(float(scores[i]), 3), self.entries[i]) for i in best]
@@ -0,0 +1,106 @@
+## Fast JSON encoding and precompressed, ETag-validated responses
+##
+## The Dash layout (including the figure) only changes when a new data
+## snapshot is published, so it is encoded once per data version with orjson,
+## compressed once per encoding, and every page load after that is a byte copy
+## or a 304.
+
+import datetime
+import gzip
+import hashlib
+import json
+import threading
+
+from flask import Response
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(obj):
+    ## Called by orjson for everything it does not encode natively. numpy and
+    ## pandas are imported here so importing this module does not load them
+    import numpy as np
+    import pandas as pd
+
+    if hasattr(obj, "to_plotly_json"):
+        return obj.to_plotly_json()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "M":
+            return np.datetime_as_string(obj).tolist()
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (pd.Timestamp, datetime.date)):
+        return obj.isoformat()
+    return json.loads(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+
+def dumps(obj):
+    """Encode a Dash component tree or plotly figure to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, cls=PlotlyJSONEncoder).encode("utf-8")
+
+
+class Encoded(object):
+    """One JSON body with its precompressed variants and strong ETags."""
+
+    def __init__(self, body):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        ## Content-Encoding -> (payload, ETag); each representation gets its own strong ETag
+        self.variants = {None: (body, '"%s"' % digest),
+                         "gzip": (gzip.compress(body, 6), '"%s-gz"' % digest)}
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=5), '"%s-br"' % digest)
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def respond(self, request, mimetype="application/json", cache_control="no-cache"):
+        if_none_match = request.headers.get("If-None-Match", "")
+        ## Highest q-value wins, br on a tie; q=0 refuses a coding, also through "*"
+        accepted = request.accept_encodings
+        encoding, best = None, 0
+        for candidate in ("br", "gzip"):
+            quality = accepted[candidate] if candidate in self.variants else 0
+            if quality > best:
+                encoding, best = candidate, quality
+        payload, etag = self.variants[encoding]
+
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            response = Response(status=304)
+        else:
+            response = Response(payload, mimetype=mimetype)
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+
+class VersionedCache(object):
+    """Keeps the Encoded body of the latest data version, built once per version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = (None, None)
+
+    def get(self, version, encode):
+        """The Encoded body for `version`, calling `encode()` for its JSON bytes on a miss."""
+        cached_version, encoded = self._entry
+        if cached_version == version and encoded is not None:
+            return encoded
+        with self._lock:
+            cached_version, encoded = self._entry
+            if cached_version != version or encoded is None:
+                encoded = Encoded(encode())
+                self._entry = (version, encoded)
+            return encoded
@@ -0,0 +1,149 @@
+## Sharing one data snapshot between gunicorn workers through memory-mapped files
+##
+## In shared mode (ONTSCHOOLS_SHARED_DIR is set) a single loader process runs
+## the refresher (see loader.py) and publishes every snapshot into
+## <SHARED_DIR>/<version>/: the source frames as uncompressed Arrow IPC files,
+## the derived frames and figure as a pickle, and the encoded layout. The
+## CURRENT file names the latest version and is replaced atomically. Workers
+## map the Arrow files read-only, so the pages holding the history live once
+## in the page cache instead of once per worker, and no worker downloads or
+## parses anything.
+
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import pyarrow as pa
+
+from fetch import write_atomic
+from store import ActiveView
+
+logger = logging.getLogger(__name__)
+
+
+CURRENT = "CURRENT"
+
+## File name -> (snapshot attribute path, keep the index)
+TABLES = {
+    "summary.arrow": (("df_sum",), False),
+    "history.arrow": (("active", "history"), False),
+    "latest.arrow": (("active", "latest"), False),
+    "schools.arrow": (("active", "schools"), True),
+}
+
+
+def _write_table(path, df, preserve_index):
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    with pa.OSFile(path, "wb") as sink:
+        writer = pa.ipc.new_file(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+
+def _map_table(path):
+    ## split_blocks lets numeric and date columns point straight into the mapping
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def publish(snapshot, directory, layout_json, keep=2):
+    """Write a snapshot for workers to attach to and point CURRENT at it."""
+    target = os.path.join(directory, snapshot.version)
+    if not os.path.exists(target):
+        tmp = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+        try:
+            for name, (attrs, preserve_index) in TABLES.items():
+                df = snapshot
+                for attr in attrs:
+                    df = getattr(df, attr)
+                _write_table(os.path.join(tmp, name), df, preserve_index)
+            meta = {"version": snapshot.version, "hashes": snapshot.hashes, "loaded_at": snapshot.loaded_at,
+                    "frames": snapshot.frames, "fig": snapshot.fig}
+            with open(os.path.join(tmp, "snapshot.pickle"), "wb") as fh:
+                pickle.dump(meta, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(os.path.join(tmp, "layout.json"), "wb") as fh:
+                fh.write(layout_json)
+            os.rename(tmp, target)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+    write_atomic(os.path.join(directory, CURRENT), snapshot.version.encode("ascii"))
+    logger.info("Published shared snapshot %s", snapshot.version)
+
+    ## Older versions can go: workers that still map them keep the pages until they move on
+    versions = [name for name in os.listdir(directory)
+                if not name.startswith(".") and os.path.isdir(os.path.join(directory, name))]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+    for name in versions[keep:]:
+        if name != snapshot.version:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class SharedSnapshot(object):
+    """A published snapshot attached read-only, with the same fields as refresh.Snapshot."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "snapshot.pickle"), "rb") as fh:
+            meta = pickle.load(fh)
+        self.version = meta["version"]
+        self.hashes = meta["hashes"]
+        self.loaded_at = meta["loaded_at"]
+        self.frames = meta["frames"]
+        self.fig = meta["fig"]
+        self.df_sum = _map_table(os.path.join(path, "summary.arrow"))
+        self.active = ActiveView(
+            _map_table(os.path.join(path, "history.arrow")),
+            _map_table(os.path.join(path, "latest.arrow")),
+            _map_table(os.path.join(path, "schools.arrow")),
+        )
+
+    def layout_json(self):
+        with open(os.path.join(self.path, "layout.json"), "rb") as fh:
+            return fh.read()
+
+
+class SharedReader(object):
+    """Worker side of shared mode; a drop-in for DataRefresher.current()."""
+
+    def __init__(self, directory, poll=1.0):
+        self.directory = directory
+        self._poll = poll
+        self._checked = 0.0
+        self._snapshot = None
+
+    def start(self):
+        return self
+
+    def _published_version(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT)) as fh:
+                return fh.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked < self._poll:
+            return self._snapshot
+        self._checked = now
+        version = self._published_version()
+        if version is not None and (self._snapshot is None or self._snapshot.version != version):
+            try:
+                self._snapshot = SharedSnapshot(os.path.join(self.directory, version))
+            except (OSError, pickle.UnpicklingError, pa.ArrowInvalid):
+                logger.exception("Could not attach shared snapshot %s", version)
+        return self._snapshot
+
+    def wait_ready(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._checked = 0.0
+            if self.current() is not None:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
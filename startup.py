@@ -0,0 +1,52 @@
+## Startup phase timing
+##
+## Each phase of a cold start (imports, the first fetch, parse, transform and
+## figure build, the first encoded layout) is timed the first time it runs;
+## later refreshes are not startup and are ignored here. The phases are logged
+## once the first data-backed layout is served, and are available as JSON at
+## /_stats/startup.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+## Imported first by app.py, so this is as close to process start as Python gets
+STARTED = time.time()
+
+_phases = OrderedDict()
+_lock = threading.Lock()
+
+
+def record(name, seconds):
+    """Keep the duration of phase `name`, the first time it is recorded only."""
+    with _lock:
+        _phases.setdefault(name, seconds)
+
+
+@contextmanager
+def phase(name):
+    """Time the body as phase `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def ready():
+    """Mark the first data-backed response: record the time since start and log every phase."""
+    with _lock:
+        if "ready" in _phases:
+            return
+        _phases["ready"] = time.time() - STARTED
+        summary = ", ".join("%s %.2fs" % item for item in _phases.items())
+    logger.info("Startup phases: %s", summary)
+
+
+def report():
+    with _lock:
+        return {"started": STARTED, "phases": OrderedDict((name, round(seconds, 4)) for name, seconds in _phases.items())}
@@ -0,0 +1,347 @@
+## Incremental, append-only store for the active-schools data set
+##
+## schoolsactivecovid.csv only ever grows by appending the newest reported
+## days at the end. The store remembers how many bytes of the file it already
+## ingested, a sha256 of those bytes and the last line it saw there. When the
+## next download still has that line at the same offset and the same bytes
+## before it, only the bytes after it are parsed; anything else (a rewritten
+## file, or an earlier row corrected in place) falls back to a full re-ingest. Either way the CSV
+## is parsed in chunks of config.INGEST_CHUNK_ROWS rows, so a refresh never
+## holds the raw file.
+##
+## Parts are partitioned by school year and month on disk:
+##
+##     active_store/school_year=2020-2021/month=2020-09/part-00000.parquet
+##     active_store/school_year=2020-2021/schools.parquet
+##
+## The view the dashboard works on covers the current school year only, so
+## loading and aggregating it does not grow with the years behind it; earlier
+## years stay on disk untouched. The latest reported day and the per-school
+## aggregates of the year are updated from the new rows only.
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process locking, which only matters with several workers
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+import config
+import data
+import metrics
+import normalize
+import schoolyear
+from fetch import write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _locked(path):
+    """Hold an exclusive lock on `path` across processes (gunicorn workers share the store)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+## Bump when the cleaned active frame, or the layout of the parts, changes
+STORE_FORMAT = 5
+
+ActiveView = namedtuple("ActiveView", ["history", "latest", "schools"])
+
+
+class FrameCache(object):
+    """A cleaned, typed frame kept as Parquet and keyed on the sha256 of its source CSV.
+
+    Loading the Parquet file (memory-mapped) replaces re-parsing the CSV and
+    re-running the date conversion on every worker start.
+    """
+
+    def __init__(self, name, directory=None):
+        base = config.CACHE_DIR if directory is None else directory
+        os.makedirs(base, exist_ok=True)
+        self.path = os.path.join(base, name + ".parquet")
+        self._key_path = self.path + ".sha256"
+
+    def _key(self):
+        if not (os.path.exists(self._key_path) and os.path.exists(self.path)):
+            return None
+        with open(self._key_path) as fh:
+            return fh.read().strip()
+
+    def read(self):
+        """The cached frame, whatever CSV it came from, or None when nothing is cached."""
+        if self._key() is None:
+            return None
+        return pd.read_parquet(self.path, memory_map=True)
+
+    def load(self, sha256, parse):
+        """The cached frame for `sha256`, calling `parse()` and caching its result on a miss."""
+        with _locked(self.path + ".lock"):
+            if self._key() == sha256:
+                return self.read()
+            df = parse()
+            tmp = self.path + ".tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self.path)
+            write_atomic(self._key_path, sha256.encode("ascii"))
+            return df
+
+## Per-school aggregates over the whole history and how to merge two of them
+SCHOOL_AGGREGATES = {
+    "first_reported": ("reported_date", "min"),
+    "last_reported": ("reported_date", "max"),
+    "days_reported": ("reported_date", "count"),
+    "peak_cases": ("total_confirmed_cases", "max"),
+}
+SCHOOL_MERGE = {"first_reported": "min", "last_reported": "max", "days_reported": "sum", "peak_cases": "max"}
+
+
+def aggregate_schools(df):
+    ## The school index is kept as plain strings so two aggregates always line up
+    schools = df.groupby("school", observed=True).agg(**SCHOOL_AGGREGATES)
+    schools.index = schools.index.astype(str)
+    return schools
+
+
+def _merge_schools(schools, new_schools):
+    return pd.concat([schools, new_schools]).groupby(level=0).agg(SCHOOL_MERGE)
+
+
+def _year_directory(year):
+    return "school_year=%s" % schoolyear.label(year)
+
+
+def _partition(calendar_year, month):
+    """Directory of one month's partition, relative to the store."""
+    return "%s/month=%04d-%02d" % (_year_directory(schoolyear.start_year(calendar_year, month)), calendar_year, month)
+
+
+def _split_months(chunk):
+    """(calendar year, month, rows) of each month in a chunk, oldest first."""
+    keys = (chunk.reported_date.dt.year * 100 + chunk.reported_date.dt.month).to_numpy()
+    for key in np.unique(keys):
+        yield int(key // 100), int(key % 100), chunk[keys == key]
+
+
+def _blank_from(fh, offset, block=65536):
+    """True when nothing but whitespace follows `offset`."""
+    fh.seek(offset)
+    for chunk in iter(lambda: fh.read(block), b""):
+        if chunk.strip():
+            return False
+    return True
+
+
+def _hash_range(fh, digest, start, end, block=1 << 20):
+    """Feed bytes [start, end) of `fh` to `digest`."""
+    fh.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = fh.read(min(block, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest
+
+
+def _last_line(fh, size, block=65536):
+    """The bytes of the last line of a file, trailing newline included."""
+    start = max(0, size - block)
+    fh.seek(start)
+    chunk = fh.read(size - start)
+    cut = chunk.rfind(b"\n", 0, len(chunk) - 1)
+    return chunk[cut + 1:]
+
+
+class ActiveStore(object):
+    """Parsed history of the active-schools data set, kept as Parquet parts per school year and month."""
+
+    def __init__(self, directory=None):
+        base = config.CACHE_DIR if directory is None else directory
+        self.directory = os.path.join(base, "active_store")
+        os.makedirs(self.directory, exist_ok=True)
+        self._state_path = os.path.join(self.directory, "state.json")
+        self._lock_path = os.path.join(self.directory, "lock")
+        self._state = self._load_state()
+        self._view = None
+
+    def _load_state(self):
+        if not os.path.exists(self._state_path):
+            return {}
+        with open(self._state_path) as fh:
+            state = json.load(fh)
+        ## Parts written with another set of columns or dtypes are re-ingested
+        return state if state.get("format") == STORE_FORMAT else {}
+
+    def _save_state(self):
+        write_atomic(self._state_path, json.dumps(self._state).encode("utf-8"))
+
+    def _part_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_parts(self, prefix):
+        parts = [pd.read_parquet(self._part_path(name), memory_map=True)
+                 for name in self._state.get("parts", []) if name.startswith(prefix + "/")]
+        return data.concat_active(parts)
+
+    def view(self):
+        """The ActiveView of the current school year, loaded from its partitions on first use."""
+        if self._view is None and self._state.get("year") is not None:
+            directory = _year_directory(self._state["year"])
+            history = self._read_parts(directory)
+            latest = history[history.reported_date == history.reported_date.max()]
+            schools = pd.read_parquet(self._part_path(directory + "/schools.parquet"))
+            self._view = ActiveView(history, latest, schools)
+        return self._view
+
+    def _appended_offset(self, fh, size, header):
+        """(offset where new rows start, sha256 of the bytes before it), or (None, None)
+        when the file was not just appended to."""
+        state = self._state
+        if not state or state.get("digest") is None or self.view() is None:
+            return None, None
+        boundary = state["boundary"].encode("latin-1")
+        offset = state["offset"]
+        if size < offset or header != state["header"].encode("latin-1"):
+            return None, None
+        fh.seek(offset - len(boundary))
+        if fh.read(len(boundary)) != boundary:
+            return None, None
+        ## An earlier row corrected in place keeps the boundary where it was;
+        ## hashing the ingested bytes again is much cheaper than parsing them
+        digest = _hash_range(fh, hashlib.sha256(), 0, offset)
+        if digest.hexdigest() != state["digest"]:
+            return None, None
+        return offset, digest
+
+    def ingest(self, csv_path):
+        """Bring the store up to date with a downloaded copy of the data set."""
+        with _locked(self._lock_path):
+            ## Another worker may have ingested since we last looked
+            state = self._load_state()
+            if state != self._state:
+                self._state = state
+                self._view = None
+            return self._ingest(csv_path)
+
+    def _ingest(self, csv_path):
+        size = os.path.getsize(csv_path)
+        with open(csv_path, "rb") as fh:
+            header = fh.readline()
+            offset, digest = self._appended_offset(fh, size, header)
+            full = offset is None
+            if full:
+                digest, hashed = hashlib.sha256(), 0
+                offset = len(header)
+                self._reset()
+            elif _blank_from(fh, offset):
+                return self._view
+            else:
+                hashed = offset
+
+            ## Parsed chunk by chunk, each written as its own part, instead of
+            ## reading the whole download and parsing it in one frame
+            encoding = normalize.detect_file_encoding(fh, offset)
+            names = next(csv.reader([header.decode(normalize.detect_encoding(header))]))
+            fh.seek(offset)
+            rows = self._append(data.iter_active(fh, encoding, names))
+            boundary = _last_line(fh, size)
+            _hash_range(fh, digest, hashed, size)
+
+        logger.info("Ingested %d new active-school rows (%s)", rows, "full" if full else "append")
+        metrics.INGESTED_ROWS.inc("full" if full else "append", amount=rows)
+        self._state.update({
+            "header": header.decode("latin-1"),
+            "boundary": boundary.decode("latin-1"),
+            "offset": size,
+            "digest": digest.hexdigest(),
+        })
+        self._save_state()
+        return self._view
+
+    def _reset(self):
+        ## Forget the old parts first, so a re-ingest that fails halfway starts over next time
+        if os.path.exists(self._state_path):
+            os.unlink(self._state_path)
+        for entry in os.listdir(self.directory):
+            path = self._part_path(entry)
+            if entry.startswith("school_year="):
+                shutil.rmtree(path)
+            elif entry.endswith(".parquet"):
+                ## Flat parts of an older store format
+                os.unlink(path)
+        self._state = {"format": STORE_FORMAT, "parts": []}
+        self._view = None
+
+    def _save_schools(self, year, schools):
+        schools.to_parquet(self._part_path(_year_directory(year) + "/schools.parquet"))
+
+    def _append(self, chunks):
+        """Write each month of every cleaned chunk to its partition and fold the rows of the
+        current school year into the view; the number of rows added."""
+        view = self._view
+        year = self._state.get("year") if view is not None else None
+        schools = None if view is None else view.schools
+        latest_date = None if view is None else view.latest.reported_date.max()
+        latest = [] if view is None else [view.latest]
+        frames = [] if view is None else [view.history]
+        rows = 0
+        changed = False
+
+        for chunk in chunks:
+            for calendar_year, month, part in _split_months(chunk):
+                directory = _partition(calendar_year, month)
+                os.makedirs(self._part_path(directory), exist_ok=True)
+                name = "%s/part-%05d.parquet" % (directory, len(self._state["parts"]))
+                part.to_parquet(self._part_path(name), index=False)
+                self._state["parts"].append(name)
+                rows += len(part)
+
+                part_year = schoolyear.start_year(calendar_year, month)
+                if year is not None and part_year < year:
+                    ## An earlier school year: kept on disk, outside the current view
+                    continue
+                if year is not None and part_year > year:
+                    ## A new school year starts a new view
+                    if changed:
+                        self._save_schools(year, schools)
+                    schools, latest_date, latest, frames = None, None, [], []
+                year = part_year
+                changed = True
+
+                with metrics.stage("aggregate_schools"):
+                    part_schools = aggregate_schools(part)
+                schools = part_schools if schools is None else _merge_schools(schools, part_schools)
+                part_date = part.reported_date.max()
+                if latest_date is None or part_date > latest_date:
+                    latest_date = part_date
+                    latest = [part[part.reported_date == part_date]]
+                else:
+                    latest.append(part[part.reported_date == latest_date])
+                frames.append(part)
+
+        if changed:
+            ## One concatenation for the whole download rather than one per chunk
+            self._save_schools(year, schools)
+            self._state["year"] = year
+            self._view = ActiveView(data.concat_active(frames), data.concat_active(latest), schools)
+        return rows
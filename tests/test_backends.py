@@ -0,0 +1,32 @@
+import sqlite3
+
+from backends import SQLBackend, write_database
+
+SUMMARY = "collected_date,reported_date,new_total_school_related_cases\n2020-09-15,2020-09-14,3\n"
+ACTIVE = ("collected_date,reported_date,school_id,school_board,school,municipality,"
+          "confirmed_student_cases,confirmed_staff_cases,confirmed_unspecified_cases,total_confirmed_cases\n"
+          "2020-09-15,2020-09-14,1001,Toronto District School Board,Maple Public School,Toronto,1,0,0,1\n"
+          "2020-09-15,2020-09-14,1003,Ottawa-Carleton District School Board,Riverview Public School,Ottawa,2,0,0,2\n")
+
+
+def _fingerprints(backend):
+    with backend._connect() as con:
+        return backend._fingerprints(con)[0]
+
+
+def test_in_place_correction_changes_fingerprint(tmp_path):
+    for name, body in (("summary.csv", SUMMARY), ("active.csv", ACTIVE)):
+        (tmp_path / name).write_text(body, encoding="utf-8")
+    path = str(tmp_path / "ontschools.db")
+    write_database("sqlite:" + path, str(tmp_path / "summary.csv"), str(tmp_path / "active.csv"))
+    backend = SQLBackend(path)
+    before = _fingerprints(backend)
+    assert _fingerprints(backend) == before
+
+    ## A case moved between two schools: same count, last day and sum
+    con = sqlite3.connect(path)
+    con.execute("UPDATE active SET total_confirmed_cases = 2 WHERE school_id = 1001")
+    con.execute("UPDATE active SET total_confirmed_cases = 1 WHERE school_id = 1003")
+    con.commit()
+    con.close()
+    assert _fingerprints(backend)["active"] != before["active"]
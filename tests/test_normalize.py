@@ -0,0 +1,13 @@
+from normalize import NameFixer
+
+
+def test_longest_entry_wins_wherever_it_starts():
+    fixer = NameFixer([("Saint", "SHORT"), ("Isidore Catholic Elementary", "LONG")])
+    assert fixer("Saint-Isidore Catholic Elementary School") == "LONG"
+    assert fixer("Saint-Michel Catholic Elementary School") == "SHORT"
+    assert fixer("Riverview Public School") == "Riverview Public School"
+
+
+def test_overlapping_entries():
+    fixer = NameFixer([("Sainte-Mar", "A"), ("Marie-Curie", "B")])
+    assert fixer("École Sainte-Marie-Curie") == "B"
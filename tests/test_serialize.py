@@ -0,0 +1,25 @@
+import flask
+import pytest
+
+from serialize import Encoded
+
+BODY = b'{"data": [' + b"1, " * 500 + b"1]}"
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip;q=0, identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("*;q=0, identity", None),
+    ("", None),
+])
+def test_encoding_follows_q_values(accept, expected):
+    encoded = Encoded(BODY)
+    if "br" not in encoded.variants and expected == "br":
+        expected = "gzip"
+    with flask.Flask(__name__).test_request_context(headers={"Accept-Encoding": accept}):
+        response = encoded.respond(flask.request)
+    assert response.headers.get("Content-Encoding") == expected
+    assert response.get_data() == encoded.variants[expected][0]
@@ -0,0 +1,70 @@
+import datetime
+
+import pandas as pd
+import pandas.testing as pdt
+
+from store import ActiveStore
+
+HEADER = ("collected_date,reported_date,school_id,school_board,school,municipality,"
+          "confirmed_student_cases,confirmed_staff_cases,confirmed_unspecified_cases,total_confirmed_cases\n")
+SCHOOLS = [
+    (1001, "Toronto District School Board", "Maple Public School", "Toronto"),
+    (1002, "Conseil scolaire catholique MonAvenir", "École élémentaire Saint-Michel", "Toronto"),
+    (1003, "Ottawa-Carleton District School Board", "Riverview Public School", "Ottawa"),
+]
+
+
+def _rows(days, cases=1):
+    lines = []
+    for day in days:
+        for school_id, board, school, municipality in SCHOOLS:
+            lines.append('%s,%s,%d,%s,"%s",%s,%d,0,0,%d\n' % (
+                day + datetime.timedelta(days=1), day, school_id, board, school, municipality, cases, cases))
+    return lines
+
+
+DAYS = [datetime.date(2020, 9, 14) + datetime.timedelta(days=i) for i in range(10)]
+
+
+def _write(path, lines):
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(HEADER)
+        fh.writelines(lines)
+
+
+def _full(tmp_path, csv_path):
+    return ActiveStore(str(tmp_path / "full")).ingest(str(csv_path)).history
+
+
+def _assert_same(view, expected):
+    pdt.assert_frame_equal(view.history.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_append_matches_full_ingest(tmp_path):
+    csv_path = tmp_path / "active.csv"
+    store = ActiveStore(str(tmp_path / "append"))
+    _write(csv_path, _rows(DAYS[:6]))
+    store.ingest(str(csv_path))
+
+    _write(csv_path, _rows(DAYS[:6]) + _rows(DAYS[6:]))
+    view = store.ingest(str(csv_path))
+
+    assert store._state["offset"] == csv_path.stat().st_size
+    _assert_same(view, _full(tmp_path, csv_path))
+    assert view.latest.reported_date.max() == pd.Timestamp(DAYS[-1])
+
+
+def test_correction_before_offset_reingests(tmp_path):
+    csv_path = tmp_path / "active.csv"
+    store = ActiveStore(str(tmp_path / "append"))
+    _write(csv_path, _rows(DAYS[:6]))
+    store.ingest(str(csv_path))
+
+    ## Same length and same last line: only the digest tells the prefix changed
+    corrected = _rows(DAYS[:1], cases=2) + _rows(DAYS[1:6]) + _rows(DAYS[6:])
+    _write(csv_path, corrected)
+    view = store.ingest(str(csv_path))
+
+    _assert_same(view, _full(tmp_path, csv_path))
+    first = view.history[view.history.reported_date == pd.Timestamp(DAYS[0])]
+    assert (first.total_confirmed_cases == 2).all()
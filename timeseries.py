@@ -0,0 +1,74 @@
+## Weekly and rolling-window aggregates of the summary data set
+##
+## SeriesEngine keeps, for every new_* and current_* column of df_sum, the
+## weekly mean (weeks ending Sunday, as before) and the 7- and 14-day rolling
+## means. When a refresh only appends days, the rolling means are computed
+## for the new days from the trailing 14 days before them, and only the
+## weeks the new days fall in are resampled again; earlier results are kept.
+
+import pandas as pd
+
+SERIES_PREFIXES = ("new_", "current_")
+
+## Aggregation name -> pandas rolling window
+WINDOWS = {"7-day": "7D", "14-day": "14D"}
+TRAILING = pd.Timedelta(days=14)
+WEEK = pd.offsets.Week(weekday=6)
+
+AGGREGATIONS = ["weekly"] + list(WINDOWS)
+
+
+def series_columns(df_sum):
+    return [col for col in df_sum.columns if col.startswith(SERIES_PREFIXES)]
+
+
+class SeriesEngine(object):
+    """Incrementally maintained weekly and rolling means over df_sum."""
+
+    def __init__(self):
+        self._daily = None
+        self._results = {}
+
+    def update(self, df_sum):
+        """Bring the aggregates up to date with df_sum and return them."""
+        daily = df_sum.set_index("reported_date")[series_columns(df_sum)].astype("float64")
+        if not self._extends(daily):
+            self._rebuild(daily)
+        elif len(daily) > len(self._daily):
+            self._extend(daily.iloc[len(self._daily):])
+        return self.results()
+
+    def results(self):
+        """Aggregation name -> frame indexed by date, one column per series."""
+        return dict(self._results)
+
+    def _extends(self, daily):
+        ## True when daily is the previous data with days appended at the end
+        old = self._daily
+        if old is None or list(daily.columns) != list(old.columns) or len(daily) < len(old):
+            return False
+        last = len(old) - 1
+        return daily.index[last] == old.index[last] and daily.iloc[last].equals(old.iloc[last])
+
+    def _rebuild(self, daily):
+        self._daily = daily
+        self._results = {"weekly": daily.resample("W").mean()}
+        for name, window in WINDOWS.items():
+            self._results[name] = daily.rolling(window).mean()
+
+    def _extend(self, new):
+        start = new.index[0]
+        context = pd.concat([self._daily[self._daily.index > start - TRAILING], new])
+        self._daily = pd.concat([self._daily, new])
+
+        results = dict(self._results)
+        for name, window in WINDOWS.items():
+            tail = context.rolling(window).mean().loc[new.index]
+            results[name] = pd.concat([results[name], tail])
+
+        ## Resample only from the week the first new day falls in
+        week_end = WEEK.rollforward(start)
+        touched = self._daily[self._daily.index > week_end - pd.Timedelta(days=7)].resample("W").mean()
+        weekly = results["weekly"]
+        results["weekly"] = pd.concat([weekly[weekly.index < week_end], touched])
+        self._results = results
@@ -0,0 +1,382 @@
+## Filtered views of the active-schools history for the interactive controls
+##
+## FilterIndex sums the history once per data version, board sites excluded,
+## into case totals per (reported date, school board, municipality, school),
+## sorted by date. A selection is then a slice of one day's groups, masked by
+## municipality and school board, and the callbacks aggregate a few thousand
+## prebuilt totals instead of grouping the rows of the day on every
+## interaction; the unfiltered view of a day sums the whole slice.
+
+import numpy as np
+import pandas as pd
+
+import config
+import dashboard
+import kpi
+import memo
+import metrics
+from aggregates import AggregateIndex
+from history import HISTORY_COLUMNS, SchoolHistoryIndex, school_ids
+from ranking import SchoolRanking
+from search import SearchIndex
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+KPI_COLUMNS = [
+    ("total_confirmed_cases", "Active Cases"),
+    ("confirmed_student_cases", "Student"),
+    ("confirmed_staff_cases", "Staff"),
+]
+
+GROUP_KEYS = ["date", "board", "municipality", "school"]
+
+
+class FilterIndex(object):
+    """Case totals of the active history per (date, school board, municipality, school)."""
+
+    def __init__(self, history):
+        self.history = history
+        date_codes, self.dates = pd.factorize(history.reported_date, sort=True)
+        self.municipalities = history.municipality.cat.categories
+        self.boards = history.school_board.cat.categories
+        self.schools = history.school.cat.categories
+
+        ## Grouped on the integer codes; missing names keep their -1 code
+        schools = ~history.is_board_site.to_numpy()
+        keys = pd.DataFrame({
+            "date": date_codes[schools],
+            "board": history.school_board.cat.codes.to_numpy()[schools],
+            "municipality": history.municipality.cat.codes.to_numpy()[schools],
+            "school": history.school.cat.codes.to_numpy()[schools],
+        })
+        for column, _ in KPI_COLUMNS:
+            keys[column] = history[column].to_numpy()[schools]
+        totals = keys.groupby(GROUP_KEYS, sort=True).sum()
+
+        self._keys = {name: totals.index.get_level_values(name).to_numpy() for name in GROUP_KEYS}
+        self._totals = {column: totals[column].to_numpy() for column, _ in KPI_COLUMNS}
+        ## Groups of date code d are _starts[d]:_starts[d + 1]
+        self._starts = np.searchsorted(self._keys["date"], np.arange(len(self.dates) + 1))
+
+        ## History rows by date the same way, for the schools table of a selection
+        self._rows = np.argsort(date_codes, kind="mergesort")
+        self._row_starts = np.searchsorted(date_codes[self._rows], np.arange(len(self.dates) + 1))
+        self._row_keys = {"municipality": history.municipality.cat.codes.to_numpy(),
+                          "board": history.school_board.cat.codes.to_numpy()}
+
+    def date_code(self, date):
+        """Position of `date` among the reported dates, or None when nothing was reported that day."""
+        i = self.dates.searchsorted(pd.Timestamp(date))
+        if i < len(self.dates) and self.dates[i] == pd.Timestamp(date):
+            return int(i)
+        return None
+
+    def _select(self, positions, keys, municipality, board):
+        for name, value, categories in (("municipality", municipality, self.municipalities),
+                                        ("board", board, self.boards)):
+            if value:
+                if value not in categories:
+                    return EMPTY
+                positions = positions[keys[name][positions] == categories.get_loc(value)]
+        return positions
+
+    def groups(self, date_code, municipality=None, board=None):
+        """Positions of the groups one selection covers."""
+        if date_code is None:
+            return EMPTY
+        return self._select(np.arange(self._starts[date_code], self._starts[date_code + 1]),
+                            self._keys, municipality, board)
+
+    def rows(self, date_code, municipality=None, board=None):
+        """History rows of one selection, board sites included."""
+        if date_code is None:
+            return self.history.iloc[EMPTY]
+        positions = self._rows[self._row_starts[date_code]:self._row_starts[date_code + 1]]
+        return self.history.iloc[self._select(positions, self._row_keys, municipality, board)]
+
+    def kpis(self, groups, previous_groups=None):
+        """(label, value, reference) for each indicator of a selection and the previous reported day.
+
+        The reference is None when there is no previous reported day.
+        """
+        def reference(value):
+            return None if previous_groups is None else value(previous_groups)
+
+        kpis = []
+        for column, label in KPI_COLUMNS:
+            values = self._totals[column]
+            kpis.append((label, int(values[groups].sum()), reference(lambda g: int(values[g].sum()))))
+        kpis.append(("Schools with <br>Active Cases", self._school_count(groups), reference(self._school_count)))
+        return kpis
+
+    def _school_count(self, groups):
+        codes = self._keys["school"][groups]
+        return len(np.unique(codes[codes >= 0]))
+
+    def aggregate(self, groups, value="total_confirmed_cases"):
+        """AggregateIndex over the groups of a selection, rolled up like AggregateIndex(rows)."""
+        municipalities = self._keys["municipality"][groups]
+        schools = self._keys["school"][groups]
+        named = (municipalities >= 0) & (schools >= 0)
+        by_school = pd.DataFrame({"municipality": municipalities[named], "school": schools[named],
+                                  value: self._totals[value][groups][named]}) \
+            .groupby(["municipality", "school"], sort=True)[value].sum()
+        by_municipality = by_school.groupby(level="municipality").sum()
+        by_name = by_school.groupby(level="school").sum()
+
+        def named_totals(totals, **columns):
+            frame = pd.DataFrame({name: np.asarray(categories)[totals.index.get_level_values(name)]
+                                  for name, categories in columns.items()})
+            frame[value] = totals.to_numpy()
+            return frame
+
+        return AggregateIndex.from_totals(
+            named_totals(by_school, municipality=self.municipalities, school=self.schools),
+            named_totals(by_municipality, municipality=self.municipalities),
+            named_totals(by_name, school=self.schools),
+            value)
+
+
+_filter_index = memo.VersionedValue(lambda snapshot: FilterIndex(snapshot.active.history))
+
+
+def filter_index(snapshot):
+    """The FilterIndex of a snapshot, built once per data version."""
+    return _filter_index.get(snapshot)
+
+
+## Per-selection results, shared by every visitor asking for the same selection
+_selections = memo.LRUCache("selections", config.MEMO_MAX_ENTRIES, config.MEMO_MAX_MB * 2 ** 20)
+_figures = memo.LRUCache("filtered_figures", config.MEMO_MAX_ENTRIES, config.MEMO_MAX_MB * 2 ** 20)
+
+
+def selection(snapshot, date_code, municipality=None, board=None):
+    """(AggregateIndex, kpis) of one selection, memoized per data version."""
+    def compute():
+        index = filter_index(snapshot)
+        groups = index.groups(date_code, municipality, board)
+        ## The first reported day has nothing to compare with
+        previous_groups = index.groups(date_code - 1, municipality, board) if date_code else None
+
+        with metrics.stage("selection_aggregate"):
+            aggregates = index.aggregate(groups)
+        kpis = index.kpis(groups, previous_groups)
+        kpis.append(("Schools with <br>at least 2 <br>Active Cases", aggregates.schools_with_at_least(2), None))
+        return aggregates, kpis
+    return _selections.get(snapshot.version, (date_code, municipality, board), compute)
+
+
+def selection_key(index, date, municipality=None, board=None):
+    """(date code, municipality, board) of the filter controls' values.
+
+    Keyed on the resolved date so "no date" and the latest date share entries.
+    """
+    date_code = index.date_code(date[:10]) if date else len(index.dates) - 1
+    return date_code, municipality or None, board or None
+
+
+def filtered_figure(snapshot, date, municipality=None, board=None):
+    """Figure dict with the KPIs and municipality bar for one selection; its schools are in the schools table."""
+    index = filter_index(snapshot)
+    key = selection_key(index, date, municipality, board)
+    return _figures.get(snapshot.version, key, lambda: _build_filtered_figure(snapshot, index, *key))
+
+
+def _build_filtered_figure(snapshot, index, date_code, municipality, board):
+    aggregates, kpis = selection(snapshot, date_code, municipality, board)
+    municipalities = aggregates.top_municipalities(30)
+
+    ## Plain dicts: plotly's object validation would cost more than the aggregation itself
+    data = []
+    width = 1.0 / len(kpis)
+    for i, (label, value, reference) in enumerate(kpis):
+        indicator = {
+            "type": "indicator",
+            "mode": "number+delta" if reference is not None else "number",
+            "value": value,
+            "title": {"text": " <br><span style = 'font-size: 0.7em; color:#294C63'>%s</span>" % label},
+            "domain": {"x": [i * width, (i + 1) * width], "y": [0.78, 1.0]},
+        }
+        if reference is not None:
+            indicator["delta"] = {"reference": reference, "increasing": {"color": "#5DADE2"}, "decreasing": {"color": "crimson"}}
+        data.append(indicator)
+
+    data.append({
+        "type": "bar",
+        "x": municipalities["municipality"].astype(str).tolist(),
+        "y": municipalities["total_confirmed_cases"].tolist(),
+        "text": municipalities["total_confirmed_cases"].tolist(),
+        "textposition": "outside",
+        "marker": {"color": municipalities["total_confirmed_cases"].tolist(), "coloraxis": "coloraxis"},
+    })
+    shown = index.dates[date_code].date() if date_code is not None else "no report"
+    return {
+        "data": data,
+        "layout": {
+            "plot_bgcolor": "white",
+            "showlegend": False,
+            "title": {"text": "Active COVID-19 Cases On: %s" % shown, "x": 0.05, "font": {"color": "#3D92A8"}},
+            "xaxis": {"domain": [0.0, 1.0], "anchor": "y", "tickangle": -40, "tickfont": {"size": 11}},
+            "yaxis": {"domain": [0.0, 0.65], "anchor": "x", "showgrid": True, "showticklabels": False},
+            "coloraxis": {"colorscale": "RdBu_r", "showscale": False},
+        },
+    }
+
+
+def series_label(column):
+    return column.replace("_", " ").capitalize()
+
+
+def trend_figure(snapshot, column, aggregation):
+    """Figure dict of one summary series under one of the timeseries aggregations."""
+    def build():
+        series = snapshot.frames["series"][aggregation][column].dropna().round(1)
+        dates = [d.date().isoformat() for d in series.index]
+        trace = {"x": dates, "y": series.tolist(), "marker": {"color": "#5DADE2"}}
+        if aggregation == "weekly":
+            trace.update(type = "bar")
+        else:
+            trace.update(type = "scatter", mode = "lines")
+        return {
+            "data": [trace],
+            "layout": {
+                "plot_bgcolor": "white",
+                "title": {"text": "%s (%s average)" % (series_label(column), aggregation), "x": 0.05, "font": {"color": "#3D92A8"}},
+                "xaxis": {"tickformat": "%b %d\n%Y"},
+                "yaxis": {"showgrid": True, "gridcolor": "lightgrey"},
+            },
+        }
+    return _figures.get(snapshot.version, ("trend", column, aggregation), build)
+
+
+def summary_figure(snapshot, reference):
+    """The main figure with the KPI deltas against `reference`, one of kpi.REFERENCES."""
+    if reference == kpi.DEFAULT_REFERENCE or reference not in dict(kpi.REFERENCES):
+        return snapshot.fig
+    return _figures.get(snapshot.version, ("summary", reference),
+                        lambda: dashboard.with_reference(snapshot.fig, snapshot.frames["kpis"], reference))
+
+
+MAP_TITLES = {"municipality": "Municipality", "health_unit": "Public Health Unit"}
+
+
+def map_figure(snapshot, layer, level, url):
+    """Choropleth dict of the latest day's active cases by geo layer; the geometry is only referenced by `url`."""
+    def build():
+        import geo
+        municipalities = snapshot.frames["aggregates"].municipalities
+        keys, names, totals, unmatched = geo.totals(layer, municipalities.municipality.astype(str),
+                                                    municipalities.total_confirmed_cases.tolist())
+        title = "Active Cases by %s on %s" % (MAP_TITLES[layer], snapshot.frames["last_reported_date"].date())
+        if unmatched:
+            title += "<br><span style='font-size:0.7em'>%d municipalities without a boundary</span>" % len(unmatched)
+        return {
+            "data": [{
+                "type": "choropleth",
+                "geojson": url,
+                "featureidkey": "id",
+                "locations": keys,
+                "z": totals,
+                "text": names,
+                "coloraxis": "coloraxis",
+                "marker": {"line": {"width": 0.3, "color": "white"}},
+                "hovertemplate": "%{text}<br>%{z} active cases<extra></extra>",
+            }],
+            "layout": {
+                "title": {"text": title, "x": 0.05, "font": {"color": "#3D92A8"}},
+                "geo": {"fitbounds": "locations", "visible": False},
+                "coloraxis": {"colorscale": "RdBu_r", "cmin": 0},
+                "margin": {"l": 10, "r": 10, "t": 60, "b": 10},
+                ## Keeps the user's zoom when a finer level replaces the figure
+                "uirevision": layer,
+            },
+        }
+    return _figures.get(snapshot.version, ("map", layer, level), build)
+
+
+_school_history = memo.VersionedValue(lambda snapshot: SchoolHistoryIndex(snapshot.active.history))
+
+
+def school_history_index(snapshot):
+    """The SchoolHistoryIndex of a snapshot, built once per data version."""
+    return _school_history.get(snapshot)
+
+
+def school_options(snapshot, n=100):
+    """Dropdown options for the n schools with the most active cases on the latest day."""
+    latest = snapshot.active.latest
+    latest = latest[~latest.is_board_site]
+    ranked = pd.DataFrame({
+        "id": school_ids(latest),
+        "school": latest.school.astype(str).to_numpy(),
+        "municipality": latest.municipality.astype(str).to_numpy(),
+        "cases": latest.total_confirmed_cases.to_numpy(),
+    }).sort_values("cases", ascending=False, kind="mergesort").drop_duplicates("id").head(n)
+    return [{"label": "%s (%s)" % (row.school, row.municipality), "value": row.id}
+            for row in ranked.itertuples(index=False)]
+
+
+_school_ranking = memo.VersionedValue(lambda snapshot: SchoolRanking(snapshot.active.latest))
+_rankings = memo.LRUCache("school_rankings", config.MEMO_MAX_ENTRIES, config.MEMO_MAX_MB * 2 ** 20)
+
+
+def school_ranking(snapshot, date=None, municipality=None, board=None):
+    """The SchoolRanking of one selection of the filter controls, with its presorted orders.
+
+    The latest day without filters is built once per data version, the other
+    selections are memoized per data version.
+    """
+    index = filter_index(snapshot)
+    key = selection_key(index, date, municipality, board)
+    if key == (len(index.dates) - 1, None, None):
+        return _school_ranking.get(snapshot)
+    return _rankings.get(snapshot.version, key, lambda: SchoolRanking(index.rows(*key)))
+
+
+def school_table_page(snapshot, page, size, sort_by=None, date=None, municipality=None, board=None):
+    """(rows of one page, page count) of the schools table for one selection."""
+    ranking = school_ranking(snapshot, date, municipality, board)
+    return ranking.page(page, size, sort_by), ranking.page_count(size)
+
+
+_search_index = memo.VersionedValue(lambda snapshot: SearchIndex.from_history(school_history_index(snapshot)))
+
+
+def search_index(snapshot):
+    """The SearchIndex over every school and municipality of a snapshot, built once per data version."""
+    return _search_index.get(snapshot)
+
+
+def search_options(snapshot, query, selected=None, limit=20):
+    """School dropdown options matching a type-ahead query, keeping the selected school listed."""
+    options = [{"label": label, "value": value}
+               for _, (_, label, value) in search_index(snapshot).search(query, limit, kind="school")]
+    index = school_history_index(snapshot)
+    if selected and selected in index and selected not in [option["value"] for option in options]:
+        school, municipality, _ = index.describe(selected)
+        options.append({"label": "%s (%s)" % (school, municipality), "value": selected})
+    return options
+
+
+def school_history_figure(snapshot, school_id):
+    """Figure dict of one school's student, staff and total cases over time."""
+    def build():
+        index = school_history_index(snapshot)
+        if school_id not in index:
+            return {"data": [], "layout": {"title": {"text": "Unknown school"}}}
+        school, municipality, _ = index.describe(school_id)
+        history = index.get(school_id)
+        dates = [d.date().isoformat() for d in history.index]
+        data = [{"type": "scatter", "mode": "lines+markers", "name": series_label(col), "x": dates,
+                 "y": history[col].tolist(), "line": {"color": color}}
+                for col, color in zip(HISTORY_COLUMNS, ("crimson", "#5DADE2", "#294C63"))]
+        return {
+            "data": data,
+            "layout": {
+                "plot_bgcolor": "white",
+                "title": {"text": "%s, %s" % (school, municipality), "x": 0.05, "font": {"color": "#3D92A8"}},
+                "xaxis": {"tickformat": "%b %d\n%Y"},
+                "yaxis": {"showgrid": True, "gridcolor": "lightgrey", "title": "Confirmed Cases"},
+            },
+        }
+    return _figures.get(snapshot.version, ("school", school_id), build)